@@ -1,6 +1,6 @@
 import streamlit as st
 import genderdecoder.gd as gd
-from util import write_horizontally, get_ordered_list, init_page
+from util import write_horizontally, get_ordered_list, highlight_spans, init_page
 
 
 def main():
@@ -12,7 +12,7 @@ def main():
 
 
 def write_results(desc_input):
-    res = gd.assess(desc_input)
+    res = gd.assess(desc_input, spans=True)
     st.header("Results")
     st.subheader(str.title(res["result"]))
     st.write(res["explanation"])
@@ -20,6 +20,9 @@ def write_results(desc_input):
                        "**Feminine-Coded Words**")
     write_horizontally(get_ordered_list(res["masculine_coded_words"]),
                        get_ordered_list(res["feminine_coded_words"]))
+    st.subheader("Coded Words in the Job Description")
+    st.markdown(highlight_spans(desc_input, res["spans"]),
+                unsafe_allow_html=True)
 
 
 def write_form():
@@ -0,0 +1,193 @@
+'''
+Builds the analysis dataset the Data page reads from the scraped job ads.
+
+Parsing the stringified word lists in data/google/all.csv is slow, so this is
+done once here and saved as a typed Parquet file with real list columns and
+precomputed counts, along with per-query aggregates for the statistics and
+an inverted index of the ads by company, query and stem for the filters.
+Run from the repository root after updating all.csv:
+
+    python dataset.py
+'''
+import ast
+import os
+
+from genderdecoder.aggregate import Aggregates
+from genderdecoder.dedupe import find_near_duplicates
+from genderdecoder.index import InvertedIndex
+
+CSV = "data/google/all.csv"
+DATASET = "data/google/all.parquet"
+AGGREGATES = "data/google/all.aggregates.json"
+INDEX = "data/google/all.index.arrow"
+
+# Rows and characters of each description sent to the Data page's grid at once
+PAGE_SIZE = 50
+DESCRIPTION_CHARS = 200
+
+DROP_COLUMNS = ["Unnamed: 0.1", "Unnamed: 0", "extensions",
+                "detected_extensions", "job_id", "thumbnail", "via"]
+
+
+def parse_list(s):
+    '''
+    Parses a word list written to CSV as a Python list, e.g. "['lead']".
+    Returns None if s is not a list.
+    '''
+    try:
+        words = ast.literal_eval(s)
+    except (ValueError, SyntaxError):
+        return None
+    if not isinstance(words, list):
+        return None
+    return [str(word).strip() for word in words]
+
+
+def build_dataset(csv=CSV, path=DATASET, aggregates_path=AGGREGATES,
+                  index_path=INDEX):
+    '''
+    Reads the scraped job ads from csv, cleans them up and writes them to the
+    Parquet file at path, their per-query Aggregates to aggregates_path and
+    their InvertedIndex to index_path. Returns the DataFrame written.
+    '''
+    import pandas as pd
+
+    df = pd.read_csv(csv)
+    # Drop unneeded columns
+    df = df.drop(DROP_COLUMNS, axis=1, errors="ignore")
+    # Drop repeated header rows left by scripts/concat.py
+    df = df[df.masculine_coded_words != "masculine_coded_words"]
+    # Keep one ad per cluster of reposts (same or nearly the same description)
+    labels, sizes = find_near_duplicates(df["description"])
+    df = df.assign(cluster_size=sizes)
+    df = df[[label == row for row, label in enumerate(labels)]]
+
+    # Convert strings to lists and count their words
+    for coding in ("masculine", "feminine"):
+        words = df[f"{coding}_coded_words"].map(parse_list)
+        df[f"{coding}_coded_words"] = words
+        df[f"num_{coding}_words"] = words.str.len()
+
+    # Drop rows with nan values
+    df = df.dropna()
+    df = df.astype({"num_masculine_words": "int32",
+                    "num_feminine_words": "int32",
+                    "cluster_size": "int32",
+                    "result": "category",
+                    "query": "category"})
+
+    # Move result column to right of company_name
+    res_column = df.pop("result")
+    df.insert(2, "result", res_column)
+
+    df = df.reset_index(drop=True)
+    df.to_parquet(path, index=False)
+    build_aggregates(df).save(aggregates_path)
+    InvertedIndex.build(df, dataset=fingerprint(df)).save(index_path)
+    return df
+
+
+def fingerprint(df):
+    '''
+    Returns a short string identifying a dataset's ads and their order: its
+    number of rows and a hash of its descriptions.
+    '''
+    import hashlib
+
+    import pandas as pd
+
+    hashes = pd.util.hash_pandas_object(df["description"], index=False)
+    digest = hashlib.sha1(hashes.to_numpy().tobytes()).hexdigest()[:16]
+    return f"{len(df)}:{digest}"
+
+
+def build_aggregates(df):
+    '''
+    Returns the Aggregates of a dataset's ads, grouped by query.
+    '''
+    aggregates = Aggregates()
+    aggregates.add_frame(df, "query")
+    return aggregates
+
+
+def is_stale(csv=CSV, path=DATASET, aggregates_path=AGGREGATES,
+             index_path=INDEX):
+    '''
+    Returns whether the dataset at path, its aggregates or its index are
+    missing or older than csv.
+    '''
+    for built in (path, aggregates_path, index_path):
+        if not os.path.exists(built):
+            return True
+        if os.path.exists(csv) and os.path.getmtime(csv) > os.path.getmtime(built):
+            return True
+    return False
+
+
+def read_dataset(path=DATASET):
+    '''
+    Reads the dataset written by build_dataset(), memory-mapping the file.
+    '''
+    import pandas as pd
+
+    return pd.read_parquet(path, memory_map=True)
+
+
+def read_aggregates(path=AGGREGATES):
+    return Aggregates.load(path)
+
+
+def page_of(df, ids, page, page_size=PAGE_SIZE, columns=None,
+            max_chars=DESCRIPTION_CHARS):
+    '''
+    Returns one page of the ads ids (positions in df), with only the given
+    columns and text longer than max_chars cut short, so what is sent to the
+    grid is bounded by the page, not the dataset. The position of each ad is
+    kept in an "ad_id" column, to look its full description up by.
+
+    page - Number of the page, from 0.
+    columns - The columns to keep (default: all).
+    '''
+    import pandas as pd
+
+    ids = ids[page * page_size:(page + 1) * page_size]
+    rows = df.iloc[ids]
+    if columns is not None:
+        rows = rows[[column for column in columns if column in rows]]
+    rows = rows.copy()
+    for column in rows.columns:
+        if pd.api.types.infer_dtype(rows[column], skipna=True) == "string":
+            text = rows[column]
+            long = text.str.len() > max_chars
+            rows[column] = text.where(~long, text.str[:max_chars] + "...")
+    rows.insert(0, "ad_id", ids)
+    return rows.reset_index(drop=True)
+
+
+def read_index(path=INDEX, df=None):
+    '''
+    Reads the InvertedIndex written by build_dataset(), memory-mapping its ids.
+
+    df - Optional dataset the index will be used with; see check_index().
+    '''
+    index = InvertedIndex.load(path)
+    if df is not None:
+        check_index(index, df)
+    return index
+
+
+def check_index(index, df):
+    '''
+    Raises ValueError unless index was built from the dataset df, so its ids
+    are positions of the right ads.
+    '''
+    if index.num_ads != len(df) or index.dataset != fingerprint(df):
+        raise ValueError(f"Index of {index.num_ads} ads "
+                         f"({index.dataset or 'no fingerprint'}) was not "
+                         f"built from this dataset of {len(df)} ads; "
+                         "run dataset.py to rebuild it")
+
+
+if __name__ == "__main__":
+    df = build_dataset()
+    print(f"Wrote {len(df)} job ads to {DATASET}")
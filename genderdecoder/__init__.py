@@ -0,0 +1 @@
+from .gd import *  # noqa: F401,F403
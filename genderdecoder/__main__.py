@@ -0,0 +1,295 @@
+import argparse
+import csv
+import sys
+import time
+
+from . import corpus
+from . import dedupe
+from . import lexicons
+from . import rescore
+from . import rollup
+from . import server
+from . import stream
+from .errors import ON_ERROR, GenderDecoderError
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m genderdecoder",
+        description="Find gender-coded words in job ads.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    score = commands.add_parser(
+        "score", help="Score CSVs of job ads on all cores.")
+    score.add_argument("inputs", nargs="+",
+                       help="CSV files to score (or one CSV / JSON Lines "
+                            "file with --stream).")
+    score.add_argument("-o", "--output", required=True,
+                       help="CSV file to write the scored rows to (or JSON "
+                            "Lines with --stream, by extension).")
+    score.add_argument("--text-column", default=corpus.TEXT_COLUMN,
+                       help="Column holding the job descriptions "
+                            "(default: %(default)s).")
+    score.add_argument("--workers", type=int, default=None,
+                       help="Number of worker processes "
+                            "(default: one per core).")
+    score.add_argument("--chunksize", type=int, default=corpus.CHUNKSIZE,
+                       help="Ads per worker task (default: %(default)s).")
+    score.add_argument("--lexicon", default=lexicons.DEFAULT,
+                       help="Id of, or path to a JSON file of, the lexicon "
+                            "to score with (default: %(default)s; shipped: "
+                            f"{', '.join(lexicons.available())}).")
+    score.add_argument("--cache", metavar="FILE", default=None,
+                       help="SQLite file to cache results in, so ads seen "
+                            "before (in this or earlier runs) are not "
+                            "scored again.")
+    score.add_argument("--aggregates", metavar="FILE", default=None,
+                       help="JSON file of running statistics to add the "
+                            "scored ads to (created if missing).")
+    score.add_argument("--group-column", default=None,
+                       help="Column to group the --aggregates by, "
+                            "e.g. query.")
+    score.add_argument("--stream", action="store_true",
+                       help="Read and write one chunk at a time so memory "
+                            "use does not grow with the file size.")
+    score.add_argument("--resume", action="store_true",
+                       help="With --stream, continue an interrupted run "
+                            "from its checkpoint.")
+    score.add_argument("--start", type=int, default=0,
+                       help="With --stream, the row (CSV) or byte (JSON "
+                            "Lines) offset to start at.")
+    score.add_argument("--results", metavar="FILE", default=None,
+                       help="Also write the results, without descriptions, "
+                            "to a compact Arrow (or .parquet) file for "
+                            "genderdecoder.read_results().")
+    score.add_argument("--dedupe", nargs="?", type=float, metavar="THRESHOLD",
+                       const=dedupe.THRESHOLD, default=None,
+                       help="Score only the first of each cluster of "
+                            "near-duplicate ads (reposts), adding a "
+                            "cluster_size column. THRESHOLD is the "
+                            "similarity (0-1) at which ads are duplicates "
+                            "(default: %(const)s).")
+    score.add_argument("--weight-duplicates", action="store_true",
+                       help="With --dedupe, count each ad in the "
+                            "--aggregates once per ad in its cluster.")
+    score.add_argument("--on-error", choices=ON_ERROR, default="mark",
+                       help="What to do with rows without a description: "
+                            "mark them with an empty result, skip them, or "
+                            "stop with an error (default: %(default)s).")
+    score.add_argument("--errors", metavar="FILE", default=None,
+                       help="CSV file to list the rows that could not be "
+                            "scored in.")
+
+    serve = commands.add_parser(
+        "serve", help="Serve assess() over a local HTTP/JSON API.")
+    serve.add_argument("--host", default=server.HOST,
+                       help="Address to listen on (default: %(default)s).")
+    serve.add_argument("--port", type=int, default=server.PORT,
+                       help="Port to listen on (default: %(default)s).")
+    serve.add_argument("--lexicon", default=lexicons.DEFAULT,
+                       help="Id of, or path to a JSON file of, the lexicon "
+                            "requests use unless they name one "
+                            "(default: %(default)s).")
+    serve.add_argument("--allow", nargs="+", metavar="ID", default=None,
+                       help="Ids of the other lexicons requests may name "
+                            "(default: every lexicon available at startup).")
+    serve.add_argument("--max-batch", type=int, default=server.MAX_BATCH,
+                       help="Most single-ad requests scored together "
+                            "(default: %(default)s).")
+    serve.add_argument("--max-wait", type=float,
+                       default=server.MAX_WAIT * 1000,
+                       help="Milliseconds a request may wait for others to "
+                            "batch with (default: %(default)s).")
+
+    roll = commands.add_parser(
+        "rollup", help="Summarize scored ads per company, location or query.")
+    roll.add_argument("inputs", nargs="*",
+                      help="Scored ads to add: CSVs from score, or .arrow / "
+                           ".parquet results files.")
+    roll.add_argument("-o", "--output", default=None,
+                      help="CSV file to write the summary of --by to.")
+    roll.add_argument("--by", default="company_name",
+                      help="Dimension to summarize (default: %(default)s).")
+    roll.add_argument("--dimensions", nargs="+", default=rollup.DIMENSIONS,
+                      help="Columns to roll up by "
+                           f"(default: {' '.join(rollup.DIMENSIONS)}).")
+    roll.add_argument("--columns", nargs="+", default=None,
+                      choices=rollup.SUMMARY_COLUMNS, metavar="COLUMN",
+                      help="Summary columns to write after the dimension "
+                           "(default: all).")
+    roll.add_argument("--key-column", default=None,
+                      help="Header of the dimension's column in the summary "
+                           "(default: the dimension), e.g. company with "
+                           "--columns result for a table like data/def.csv.")
+    roll.add_argument("--state", metavar="FILE", default=None,
+                      help="Parquet file of rollup totals to add the inputs "
+                           "to (created if missing), so later runs only "
+                           "read new ads.")
+    roll.add_argument("--weight-column", default=None,
+                      help="Column of the number of ads each row stands for, "
+                           "e.g. cluster_size from --dedupe.")
+    roll.add_argument("--top", type=int, default=rollup.TOP_STEMS,
+                      help="Number of top stems to list (default: "
+                           "%(default)s).")
+    roll.add_argument("--lexicon", default=lexicons.DEFAULT,
+                      help="Id of, or path to a JSON file of, the lexicon "
+                           "the ads were scored with (default: %(default)s).")
+
+    update = commands.add_parser(
+        "rescore", help="Update a --results file after its lexicon changed, "
+                        "scoring only the ads the change affects.")
+    update.add_argument("results",
+                        help="Results file written by score --results.")
+    update.add_argument("-o", "--output", default=None,
+                        help="File to write the updated results to "
+                             "(default: back to the results file).")
+    update.add_argument("--lexicon", default=None,
+                        help="Id of, or path to a JSON file of, the lexicon "
+                             "to rescore with (default: the current version "
+                             "of the one the results were scored with).")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "rescore":
+        if args.lexicon is not None:
+            try:
+                lexicons.get(args.lexicon)
+            except (KeyError, ValueError) as e:
+                parser.error(e.args[0])
+        start = time.perf_counter()
+        try:
+            rescored = rescore.rescore_results(args.results, args.lexicon,
+                                               args.output)
+        except (GenderDecoderError, OSError, ValueError) as e:
+            parser.exit(1, f"error: {e}\n")
+        elapsed = time.perf_counter() - start
+        print(f"Rescored {len(rescored)} ads in {elapsed:.1f}s "
+              f"-> {args.output or args.results}")
+
+    if args.command == "rollup":
+        try:
+            lexicons.get(args.lexicon)
+        except (KeyError, ValueError) as e:
+            parser.error(e.args[0])
+        if args.by not in args.dimensions:
+            parser.error(f"--by {args.by} is not one of the --dimensions")
+        if not args.inputs and not args.state:
+            parser.error("nothing to roll up: give inputs or --state")
+        if not args.output and not args.state:
+            parser.error("give -o and/or --state to write to")
+
+        start = time.perf_counter()
+        try:
+            if args.state:
+                totals = rollup.Rollup.load(args.state, args.dimensions,
+                                            args.lexicon, missing_ok=True)
+            else:
+                totals = rollup.Rollup(args.dimensions, args.lexicon)
+            rows = 0
+            for path in args.inputs:
+                df = rollup.read_scored(path)
+                totals.add_frame(df, weight_column=args.weight_column)
+                rows += len(df)
+            if args.state:
+                totals.save(args.state)
+            if args.output:
+                summary = totals.summary(args.by, top=args.top)
+                if args.columns:
+                    summary = summary[[args.by, *args.columns]]
+                if args.key_column:
+                    summary = summary.rename(columns={args.by:
+                                                      args.key_column})
+                summary.to_csv(args.output, index=False)
+        except (GenderDecoderError, OSError, ValueError) as e:
+            parser.exit(1, f"error: {e}\n")
+        elapsed = time.perf_counter() - start
+        print(f"Rolled up {rows} rows in {elapsed:.1f}s, "
+              f"{len(totals.keys(args.by))} values of {args.by}")
+
+    if args.command == "serve":
+        try:
+            for lexicon in [args.lexicon, *(args.allow or [])]:
+                lexicons.get(lexicon)
+        except (KeyError, ValueError) as e:
+            parser.error(e.args[0])
+        print(f"Serving on http://{args.host}:{args.port}")
+        try:
+            server.serve(args.host, args.port, lexicon=args.lexicon,
+                         max_batch=args.max_batch,
+                         max_wait=args.max_wait / 1000, allowed=args.allow)
+        except OSError as e:
+            parser.exit(1, f"error: {e}\n")
+
+    if args.command == "score":
+        try:
+            lexicons.get(args.lexicon)
+        except (KeyError, ValueError) as e:
+            parser.error(e.args[0])
+        if args.stream and len(args.inputs) > 1:
+            parser.error("--stream takes a single input file")
+        if (args.resume or args.start) and not args.stream:
+            parser.error("--resume and --start require --stream")
+        if args.results and args.stream:
+            parser.error("--results can't be used with --stream")
+        if args.dedupe is not None and args.stream:
+            parser.error("--dedupe can't be used with --stream")
+        if args.dedupe is not None and not 0 < args.dedupe <= 1:
+            parser.error("--dedupe THRESHOLD must be between 0 and 1")
+        if args.weight_duplicates and args.dedupe is None:
+            parser.error("--weight-duplicates requires --dedupe")
+
+        errors = []
+        cache_stats = {}
+        start = time.perf_counter()
+        try:
+            if args.stream:
+                rows = stream.score_stream(args.inputs[0], args.output,
+                                           text_column=args.text_column,
+                                           chunksize=args.chunksize,
+                                           workers=args.workers,
+                                           start=args.start,
+                                           resume=args.resume,
+                                           cache_path=args.cache,
+                                           aggregates_path=args.aggregates,
+                                           group_column=args.group_column,
+                                           lexicon=args.lexicon,
+                                           on_error=args.on_error,
+                                           errors=errors,
+                                           cache_stats=cache_stats)
+            else:
+                rows = corpus.score_csvs(args.inputs, args.output,
+                                         text_column=args.text_column,
+                                         workers=args.workers,
+                                         chunksize=args.chunksize,
+                                         cache_path=args.cache,
+                                         aggregates_path=args.aggregates,
+                                         group_column=args.group_column,
+                                         lexicon=args.lexicon,
+                                         on_error=args.on_error,
+                                         errors=errors,
+                                         results_path=args.results,
+                                         dedupe=args.dedupe,
+                                         weight_duplicates=(
+                                             args.weight_duplicates),
+                                         cache_stats=cache_stats)
+        except (GenderDecoderError, OSError, ValueError) as e:
+            parser.exit(1, f"error: {e}\n")
+        elapsed = time.perf_counter() - start
+        print(f"Scored {rows} rows in {elapsed:.1f}s -> {args.output}")
+        if args.cache is not None:
+            print(f"Cache: {cache_stats.get('hits', 0)} hits, "
+                  f"{cache_stats.get('misses', 0)} misses")
+        if errors:
+            print(f"{len(errors)} rows could not be scored "
+                  f"({'skipped' if args.on_error == 'skip' else 'marked'})")
+        if args.errors is not None:
+            with open(args.errors, "w", newline="") as f:
+                writer = csv.writer(f)
+                writer.writerow(["source", "index", "error", "message"])
+                writer.writerows((record.source, record.index, record.error,
+                                  record.message) for record in errors)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,233 @@
+import json
+import os
+from collections import Counter
+
+from . import lexicons
+from .assess import RESULTS
+
+
+class GroupStats:
+    '''
+    Running statistics for a group of scored job ads: the number of ads, the
+    number per result, word totals for the means, and how often each coded
+    word and stem was used.
+    '''
+
+    def __init__(self):
+        self.num_ads = 0
+        self.results = Counter()
+        self.num_masculine_words = 0
+        self.num_feminine_words = 0
+        self.masculine_words = Counter()
+        self.feminine_words = Counter()
+        self.masculine_stems = Counter()
+        self.feminine_stems = Counter()
+
+    def add(self, result, masculine_coded_words, feminine_coded_words,
+            lexicon=None, weight=1):
+        '''
+        Adds one scored ad, as returned by assess() with lexicon.
+
+        weight - Number of ads it stands for, e.g. the size of its cluster
+                 of near-duplicates.
+        '''
+        lexicon = lexicons.get(lexicon)
+        self.num_ads += weight
+        self.results[result] += weight
+        self.num_masculine_words += len(masculine_coded_words) * weight
+        self.num_feminine_words += len(feminine_coded_words) * weight
+        # A word matching several stems is listed once per stem, so each
+        # entry counts for one of them
+        masculine_stems = [stem for stem in lexicon.matcher("masculine")
+                           .stems_of(masculine_coded_words) if stem is not None]
+        feminine_stems = [stem for stem in lexicon.matcher("feminine")
+                          .stems_of(feminine_coded_words) if stem is not None]
+        for counter, items in ((self.masculine_words, masculine_coded_words),
+                               (self.feminine_words, feminine_coded_words),
+                               (self.masculine_stems, masculine_stems),
+                               (self.feminine_stems, feminine_stems)):
+            if weight == 1:
+                counter.update(items)
+            else:
+                for item in items:
+                    counter[item] += weight
+
+    def update(self, other):
+        '''
+        Adds the statistics of another GroupStats to this one.
+        '''
+        self.num_ads += other.num_ads
+        self.results.update(other.results)
+        self.num_masculine_words += other.num_masculine_words
+        self.num_feminine_words += other.num_feminine_words
+        self.masculine_words.update(other.masculine_words)
+        self.feminine_words.update(other.feminine_words)
+        self.masculine_stems.update(other.masculine_stems)
+        self.feminine_stems.update(other.feminine_stems)
+
+    def mean_masculine_words(self):
+        return self.num_masculine_words / self.num_ads if self.num_ads else 0.0
+
+    def mean_feminine_words(self):
+        return self.num_feminine_words / self.num_ads if self.num_ads else 0.0
+
+    def result_counts(self):
+        '''
+        Returns (result, number of ads) pairs for every result, from most
+        masculine to most feminine.
+        '''
+        return [(result, self.results[result]) for result in RESULTS]
+
+    def most_common(self, coding, n=20, stems=False):
+        '''
+        Returns the n most common masculine or feminine coded words (or
+        stems) as (word, count) pairs.
+        '''
+        if coding not in ("masculine", "feminine"):
+            raise ValueError(
+                "Invalid coding given! Valid codings: masculine, feminine")
+        counter = getattr(self, f"{coding}_{'stems' if stems else 'words'}")
+        return counter.most_common(n)
+
+    def to_dict(self):
+        return {"num_ads": self.num_ads,
+                "results": dict(self.results),
+                "num_masculine_words": self.num_masculine_words,
+                "num_feminine_words": self.num_feminine_words,
+                "masculine_words": dict(self.masculine_words),
+                "feminine_words": dict(self.feminine_words),
+                "masculine_stems": dict(self.masculine_stems),
+                "feminine_stems": dict(self.feminine_stems)}
+
+    @classmethod
+    def from_dict(cls, d):
+        stats = cls()
+        stats.num_ads = d["num_ads"]
+        stats.num_masculine_words = d["num_masculine_words"]
+        stats.num_feminine_words = d["num_feminine_words"]
+        for name in ("results", "masculine_words", "feminine_words",
+                     "masculine_stems", "feminine_stems"):
+            setattr(stats, name, Counter(d[name]))
+        return stats
+
+
+class Aggregates:
+    '''
+    GroupStats for scored job ads, kept per group (e.g. per search query) and
+    updated incrementally as ads are scored, so views over any combination of
+    groups are read from the totals instead of by scanning every ad.
+
+    lexicon - Id of the lexicon the ads were scored with, used to map coded
+              words back to stems (default: lexicons.DEFAULT).
+    '''
+
+    def __init__(self, lexicon=None):
+        self.lexicon = lexicons.get(lexicon)
+        self.groups = {}
+
+    def add(self, group, result, masculine_coded_words, feminine_coded_words,
+            weight=1):
+        '''
+        Adds one scored ad to a group, counted weight times. Ads without a
+        result are skipped.
+        '''
+        # None, or NaN once in a DataFrame
+        if result is None or result != result:
+            return
+        stats = self.groups.get(group)
+        if stats is None:
+            stats = self.groups[group] = GroupStats()
+        stats.add(result, masculine_coded_words, feminine_coded_words,
+                  self.lexicon, weight)
+
+    def add_batch(self, groups, batch):
+        '''
+        Adds the ads of an assess_many() batch.
+
+        groups - The group of each ad in the batch, or a single group for all.
+                 For a batch scored with on_error="skip", the group of each
+                 input ad; those of the ads kept are picked out.
+        '''
+        if isinstance(groups, str) or groups is None:
+            groups = [groups] * len(batch["result"])
+        elif "index" in batch:
+            groups = list(groups)
+            groups = [groups[i] for i in batch["index"]]
+        masc_words = batch["masculine_coded_words"]
+        masc_offsets = batch["masculine_offsets"]
+        fem_words = batch["feminine_coded_words"]
+        fem_offsets = batch["feminine_offsets"]
+        for i, (group, result) in enumerate(zip(groups, batch["result"])):
+            self.add(group, result,
+                     masc_words[masc_offsets[i]:masc_offsets[i + 1]],
+                     fem_words[fem_offsets[i]:fem_offsets[i + 1]])
+
+    def add_frame(self, df, group_column=None, weight_column=None):
+        '''
+        Adds the ads of a DataFrame with assess() result columns, e.g. one
+        returned by batch_to_frame().
+
+        group_column - The column to group ads by (default: one group, None).
+        weight_column - Optional column of the number of ads each row stands
+                        for, e.g. "cluster_size" after near-duplicate removal.
+        '''
+        groups = df[group_column] if group_column else [None] * len(df)
+        weights = df[weight_column] if weight_column else [1] * len(df)
+        for row in zip(groups, df["result"], df["masculine_coded_words"],
+                       df["feminine_coded_words"], weights):
+            self.add(*row)
+
+    def combined(self, groups=None):
+        '''
+        Returns a GroupStats totalling the given groups (default: all).
+        '''
+        total = GroupStats()
+        for group, stats in self.groups.items():
+            if groups is None or group in groups:
+                total.update(stats)
+        return total
+
+    def to_dict(self):
+        return {"lexicon": self.lexicon.key,
+                "groups": [[group, stats.to_dict()]
+                           for group, stats in self.groups.items()]}
+
+    @classmethod
+    def from_dict(cls, d):
+        key = d.get("lexicon")
+        aggregates = cls(key.split("@")[0] if key else None)
+        # Aggregates of ads scored with other stems can't be added to
+        if key is not None and aggregates.lexicon.key != key:
+            raise ValueError(f"Aggregates were scored with {key}, but lexicon "
+                             f"'{aggregates.lexicon.id}' is now "
+                             f"{aggregates.lexicon.key}")
+        for group, stats in d["groups"]:
+            aggregates.groups[group] = GroupStats.from_dict(stats)
+        return aggregates
+
+    def save(self, path):
+        with open(f"{path}.tmp", "w") as f:
+            json.dump(self.to_dict(), f)
+        os.replace(f"{path}.tmp", path)
+
+    @classmethod
+    def load(cls, path, missing_ok=False, lexicon=None):
+        '''
+        Reads aggregates written by save(). With missing_ok, a missing file
+        gives empty aggregates for lexicon. Raises ValueError if they were
+        scored with another version of their lexicon, or with a lexicon other
+        than lexicon.
+        '''
+        try:
+            with open(path) as f:
+                aggregates = cls.from_dict(json.load(f))
+        except FileNotFoundError:
+            if missing_ok:
+                return cls(lexicon)
+            raise
+        if lexicon is not None and \
+                lexicons.get(lexicon).key != aggregates.lexicon.key:
+            raise ValueError(f"{path} holds ads scored with "
+                             f"{aggregates.lexicon.key}, not "
+                             f"{lexicons.get(lexicon).key}")
+        return aggregates
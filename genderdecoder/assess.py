@@ -1,65 +1,478 @@
-import re
-from . import wordlists
-
-
-def assess(ad_text):
-    try:
-        ad_text = ''.join([i if ord(i) < 128 else ' ' for i in ad_text])
-        ad_text = re.sub("[\\s]", " ", ad_text, 0, 0)
-        ad_text = re.sub("[\.\t\,\:;\(\)\.]", "", ad_text, 0, 0).split(" ")
-        ad_text = [ad for ad in ad_text if ad != ""]
-
-        masculine_coded_words = [adword for adword in ad_text
-                                 for word in wordlists.masculine_coded_words
-                                 if adword.startswith(word)]
-
-        feminine_coded_words = [adword for adword in ad_text
-                                for word in wordlists.feminine_coded_words
-                                if adword.startswith(word)]
-
-        if feminine_coded_words and not masculine_coded_words:
-            result = "strongly feminine-coded"
-        elif masculine_coded_words and not feminine_coded_words:
-            result = "strongly masculine-coded"
-        elif not masculine_coded_words and not feminine_coded_words:
-            result = "neutral"
+from collections import namedtuple
+from time import perf_counter
+from . import instrument
+from . import lexicons
+from .errors import ErrorRecord, check_on_error, invalid_ad
+from .normalize import normalize, tokenize, tokenize_spans, trim_span
+
+# Every result, from most masculine to most feminine. assess_counts_many()
+# returns results as indexes into this list.
+RESULTS = ["strongly masculine-coded", "masculine-coded", "neutral",
+           "feminine-coded", "strongly feminine-coded"]
+RESULT_CODES = {result: code for code, result in enumerate(RESULTS)}
+
+Counts = namedtuple("Counts",
+                    ["result", "num_masculine_words", "num_feminine_words"])
+
+FEMININE_EXPLANATION = (
+    "This job ad uses more words that are stereotypically feminine "
+    "than words that are stereotypically masculine. Fortunately, the research "
+    "suggests this will have only a slight effect on how appealing the job is "
+    "to men, and will encourage women applicants.")
+MASCULINE_EXPLANATION = (
+    "This job ad uses more words that are stereotypically masculine "
+    "than words that are stereotypically feminine. It risks putting women off "
+    "applying, but will probably encourage men to apply.")
+NO_WORDS_EXPLANATION = (
+    "This job ad doesn't use any words that are stereotypically "
+    "masculine and stereotypically feminine. It probably won't be off-putting "
+    "to men or women applicants.")
+EQUAL_EXPLANATION = (
+    "This job ad uses an equal number of words that are "
+    "stereotypically masculine and stereotypically feminine. It probably won't "
+    "be off-putting to men or women applicants.")
+
+
+def classify(num_masculine_words, num_feminine_words):
+    '''
+    Returns the coding label for an ad with the given number of masculine- and
+    feminine-coded words.
+    '''
+    if num_feminine_words and not num_masculine_words:
+        return "strongly feminine-coded"
+    if num_masculine_words and not num_feminine_words:
+        return "strongly masculine-coded"
+    if num_feminine_words > num_masculine_words:
+        return "feminine-coded"
+    if num_masculine_words > num_feminine_words:
+        return "masculine-coded"
+    return "neutral"
+
+
+def explain(result, num_masculine_words, num_feminine_words):
+    '''
+    Returns the explanation shown alongside a coding label.
+    '''
+    if "feminine" in result:
+        return FEMININE_EXPLANATION
+    if "masculine" in result:
+        return MASCULINE_EXPLANATION
+    if not num_masculine_words and not num_feminine_words:
+        return NO_WORDS_EXPLANATION
+    return EQUAL_EXPLANATION
+
+
+def _matcher(lexicon):
+    lexicon = lexicons.get(lexicon)
+    return lexicon, lexicon.combined_matcher()
+
+
+def _tokenize_timed(ad_text, times):
+    # tokenize(), adding the time spent in each half to times
+    start = perf_counter()
+    text = normalize(ad_text)
+    middle = perf_counter()
+    tokens = text.split()
+    times["normalize"] += middle - start
+    times["tokenize"] += perf_counter() - middle
+    return tokens
+
+
+def _record(times, ads, tokens, masculine_matches, feminine_matches):
+    # Adds the times and counts of a call to the instrument stats
+    for stage, seconds in times.items():
+        instrument.add_time(stage, seconds, ads)
+    instrument.count("ads", ads)
+    instrument.count("tokens", tokens)
+    instrument.count("masculine_matches", masculine_matches)
+    instrument.count("feminine_matches", feminine_matches)
+
+
+def _stage_times():
+    return {stage: 0.0 for stage in instrument.STAGES}
+
+
+def _error_record(ad_text, index):
+    error = invalid_ad(ad_text)
+    return ErrorRecord(index, type(error).__name__, str(error))
+
+
+def assess(ad_text, spans=False, lexicon=None):
+    '''
+    Assesses a job ad for gender-coded words.
+
+    spans - Also return "spans": where each coded word is in ad_text, as a
+            list of dicts with start, end, word, stem and coding, in text
+            order. Off by default; it needs the slower offset tokenizer.
+    lexicon - Id of the lexicon to use (default: lexicons.DEFAULT). The
+              result's "lexicon" records its id and version.
+
+    Raises InvalidAdError if ad_text is not a string (e.g. None or NaN), and
+    UnknownLexiconError for an unknown lexicon.
+    '''
+    if not isinstance(ad_text, str):
+        raise invalid_ad(ad_text)
+    if spans:
+        return assess_spans(ad_text, lexicon)
+    if instrument.enabled:
+        return _assess_timed(ad_text, lexicon)
+    return assess_tokens(tokenize(ad_text), lexicon)
+
+
+def assess_tokens(tokens, lexicon=None, found=None):
+    '''
+    Same as assess(), for an ad that has already been split with tokenize().
+
+    found - The lexicon's combined matcher's find(tokens), if already known.
+    '''
+    lexicon, matcher = _matcher(lexicon)
+    if found is None:
+        found = matcher.find(tokens)
+    masculine_coded_words = found["masculine"]
+    feminine_coded_words = found["feminine"]
+
+    num_masculine_words = len(masculine_coded_words)
+    num_feminine_words = len(feminine_coded_words)
+    result = classify(num_masculine_words, num_feminine_words)
+    explanation = explain(result, num_masculine_words, num_feminine_words)
+
+    return {"result": result,
+            "explanation": explanation,
+            "masculine_coded_words": masculine_coded_words,
+            "feminine_coded_words": feminine_coded_words,
+            "lexicon": lexicon.key
+            }
+
+
+def _assess_timed(ad_text, lexicon):
+    # assess_tokens(tokenize(ad_text)), timing each stage
+    times = _stage_times()
+    tokens = _tokenize_timed(ad_text, times)
+    start = perf_counter()
+    lexicon, matcher = _matcher(lexicon)
+    found = matcher.find(tokens)
+    middle = perf_counter()
+    res = assess_tokens(tokens, lexicon, found)
+    times["match"] = middle - start
+    times["result"] = perf_counter() - middle
+    _record(times, 1, len(tokens), len(res["masculine_coded_words"]),
+            len(res["feminine_coded_words"]))
+    return res
+
+
+def assess_counts(ad_text, lexicon=None):
+    '''
+    Returns only the result and word counts of assess(), as a Counts tuple,
+    without building word lists or an explanation.
+    '''
+    if not isinstance(ad_text, str):
+        raise invalid_ad(ad_text)
+    _, matcher = _matcher(lexicon)
+    counts = matcher.count(tokenize(ad_text))
+    num_masculine_words = counts["masculine"]
+    num_feminine_words = counts["feminine"]
+    return Counts(classify(num_masculine_words, num_feminine_words),
+                  num_masculine_words, num_feminine_words)
+
+
+def assess_counts_many(texts, out=None, lexicon=None, on_error="mark",
+                       errors=None):
+    '''
+    Counts-only version of assess_many(), for bulk statistics. Results are
+    written straight into NumPy arrays:
+
+        result - int8 index into RESULTS, or -1 for ads that are not strings
+        num_masculine_words, num_feminine_words - int32 counts
+
+    out - Optional dict of preallocated arrays with those keys to fill in,
+          each at least as long as texts. They are returned.
+    on_error, errors - As for assess_many(). With on_error="skip", the
+                       arrays returned are cut to the ads scored, and
+                       "index" holds their positions in texts.
+    '''
+    import numpy as np
+
+    check_on_error(on_error)
+    skip = on_error == "skip"
+    _, matcher = _matcher(lexicon)
+    # A masculine and a feminine match, packed as in the totals below
+    packed = {"masculine": 1, "feminine": 1 << 32}
+    if not hasattr(texts, "__len__"):
+        texts = list(texts)
+    if out is None:
+        out = {"result": np.empty(len(texts), dtype=np.int8),
+               "num_masculine_words": np.empty(len(texts), dtype=np.int32),
+               "num_feminine_words": np.empty(len(texts), dtype=np.int32)}
+    codes = out["result"]
+    masculine_counts = out["num_masculine_words"]
+    feminine_counts = out["num_feminine_words"]
+    if skip:
+        kept = np.empty(len(texts), dtype=np.int64)
+
+    timed = instrument.enabled
+    if timed:
+        times = _stage_times()
+        num_tokens = 0
+
+    # Both counts of a token packed in one int (feminine in the high bits),
+    # so an ad's totals are a single sum.
+    seen = {}
+    # Where the next ad's counts go: i, unless ads have been skipped
+    j = 0
+    for i, ad_text in enumerate(texts):
+        if not isinstance(ad_text, str):
+            if on_error == "raise":
+                raise invalid_ad(ad_text, i)
+            if errors is not None:
+                errors.append(_error_record(ad_text, i))
+            if not skip:
+                codes[j] = -1
+                masculine_counts[j] = feminine_counts[j] = 0
+                j += 1
+            continue
+
+        if timed:
+            tokens = _tokenize_timed(ad_text, times)
+            num_tokens += len(tokens)
+            start = perf_counter()
         else:
-            if len(feminine_coded_words) == len(masculine_coded_words):
-                result = "neutral"
-            if ((len(feminine_coded_words) / len(masculine_coded_words)) >= 2 and
-                    len(feminine_coded_words) > 5):
-                result = "strongly feminine-coded"
-            if ((len(masculine_coded_words) / len(feminine_coded_words)) >= 2 and
-                    len(masculine_coded_words) > 5):
-                result = "strongly masculine-coded"
-            if len(feminine_coded_words) > len(masculine_coded_words):
-                result = "feminine-coded"
-            if len(masculine_coded_words) > len(feminine_coded_words):
-                result = "masculine-coded"
-
-        if "feminine" in result:
-            explanation = ("This job ad uses more words that are stereotypically feminine "
-                           "than words that are stereotypically masculine. Fortunately, the research "
-                           "suggests this will have only a slight effect on how appealing the job is "
-                           "to men, and will encourage women applicants.")
-        elif "masculine" in result:
-            explanation = ("This job ad uses more words that are stereotypically masculine "
-                           "than words that are stereotypically feminine. It risks putting women off "
-                           "applying, but will probably encourage men to apply.")
-        elif not masculine_coded_words and not feminine_coded_words:
-            explanation = ("This job ad doesn't use any words that are stereotypically "
-                           "masculine and stereotypically feminine. It probably won't be off-putting "
-                           "to men or women applicants.")
+            tokens = tokenize(ad_text)
+        total = 0
+        for token in tokens:
+            hits = seen.get(token)
+            if hits is None:
+                hits = seen[token] = sum([packed.get(coding, 0) for coding, _
+                                          in matcher.match(token)])
+            if hits:
+                total += hits
+        num_masc = total & 0xFFFFFFFF
+        num_fem = total >> 32
+        codes[j] = RESULT_CODES[classify(num_masc, num_fem)]
+        masculine_counts[j] = num_masc
+        feminine_counts[j] = num_fem
+        if skip:
+            kept[j] = i
+        j += 1
+        if timed:
+            times["match"] += perf_counter() - start
+
+    if timed:
+        del times["result"]
+        _record(times, int((codes[:j] >= 0).sum()), num_tokens,
+                int(masculine_counts[:j].sum()),
+                int(feminine_counts[:j].sum()))
+    if skip:
+        out = {"result": codes[:j],
+               "num_masculine_words": masculine_counts[:j],
+               "num_feminine_words": feminine_counts[:j],
+               "index": kept[:j]}
+    return out
+
+
+def assess_spans(ad_text, lexicon=None):
+    '''
+    Same as assess(ad_text, spans=True), recording each coded word's position,
+    stem and coding in the same pass that collects the coded words.
+    '''
+    if not isinstance(ad_text, str):
+        raise invalid_ad(ad_text)
+    lexicon, matcher = _matcher(lexicon)
+    found = {coding: [] for coding in matcher.categories}
+    spans = []
+    for word, start, end in tokenize_spans(ad_text):
+        hits = matcher.match(word)
+        if not hits:
+            continue
+        start, end = trim_span(ad_text, start, end)
+        for coding, stem in hits:
+            found[coding].append(word)
+            spans.append({"start": start, "end": end, "word": word,
+                          "stem": stem, "coding": coding})
+    masculine_coded_words = found["masculine"]
+    feminine_coded_words = found["feminine"]
+
+    num_masculine_words = len(masculine_coded_words)
+    num_feminine_words = len(feminine_coded_words)
+    result = classify(num_masculine_words, num_feminine_words)
+    explanation = explain(result, num_masculine_words, num_feminine_words)
+
+    return {"result": result,
+            "explanation": explanation,
+            "masculine_coded_words": masculine_coded_words,
+            "feminine_coded_words": feminine_coded_words,
+            "spans": spans,
+            "lexicon": lexicon.key
+            }
+
+
+def assess_many(texts, cache=None, lexicon=None, on_error="mark",
+                errors=None):
+    '''
+    Assesses a batch of job ads and returns the results as columns.
+
+    Tokens are matched once per batch rather than once per ad, which pays off
+    because job ads share most of their vocabulary. Coded words are returned
+    flattened: the words of ad i are
+
+        masculine_coded_words[masculine_offsets[i]:masculine_offsets[i + 1]]
+
+    texts - Any iterable of job descriptions, e.g. a list or a pandas Series.
+    cache - Optional ResultCache to look ads up in before scoring them.
+    lexicon - Id of the lexicon to use (default: lexicons.DEFAULT), recorded
+              with its version under "lexicon".
+    on_error - What to do with ads that are not strings (e.g. NaN from
+               pandas): "mark" them with a result of None (the default),
+               "skip" them, listing the positions in texts of the ads kept
+               under "index", or "raise" InvalidAdError.
+    errors - Optional list to append an ErrorRecord to for each ad marked
+             or skipped.
+    '''
+    check_on_error(on_error)
+    skip = on_error == "skip"
+    lexicon, matcher = _matcher(lexicon)
+    results = []
+    num_masculine_words = []
+    num_feminine_words = []
+    masculine_coded_words = []
+    feminine_coded_words = []
+    masculine_offsets = [0]
+    feminine_offsets = [0]
+
+    timed = instrument.enabled
+    if timed:
+        times = _stage_times()
+        num_ads = num_tokens = 0
+
+    kept = []
+    seen = {}
+    for i, ad_text in enumerate(texts):
+        num_masc = num_fem = 0
+        if not isinstance(ad_text, str):
+            if on_error == "raise":
+                raise invalid_ad(ad_text, i)
+            if errors is not None:
+                errors.append(_error_record(ad_text, i))
+            if skip:
+                continue
+            results.append(None)
         else:
-            explanation = ("This job ad uses an equal number of words that are "
-                           "stereotypically masculine and stereotypically feminine. It probably won't "
-                           "be off-putting to men or women applicants.")
-
-        return {"result": result,
-                "explanation": explanation,
-                "masculine_coded_words": masculine_coded_words,
-                "feminine_coded_words": feminine_coded_words
-                }
-    except:
-        print("An exception occurred in assess.py")
-        return {}
+            if skip:
+                kept.append(i)
+            if timed:
+                tokens = _tokenize_timed(ad_text, times)
+                num_ads += 1
+                num_tokens += len(tokens)
+                start = perf_counter()
+            else:
+                tokens = tokenize(ad_text)
+            cached = None
+            if cache is not None:
+                key = cache.key(tokens, lexicon)
+                cached = cache.get(key)
+
+            if cached is not None:
+                result, masc, fem = cached
+                masculine_coded_words.extend(masc)
+                feminine_coded_words.extend(fem)
+                num_masc, num_fem = len(masc), len(fem)
+            else:
+                masc_start = len(masculine_coded_words)
+                fem_start = len(feminine_coded_words)
+                for token in tokens:
+                    hits = seen.get(token)
+                    if hits is None:
+                        codings = [coding for coding, _
+                                   in matcher.match(token)]
+                        hits = seen[token] = (codings.count("masculine"),
+                                              codings.count("feminine"))
+                    if hits[0]:
+                        masculine_coded_words.extend([token] * hits[0])
+                        num_masc += hits[0]
+                    if hits[1]:
+                        feminine_coded_words.extend([token] * hits[1])
+                        num_fem += hits[1]
+                result = classify(num_masc, num_fem)
+                if cache is not None:
+                    cache.put(key, result,
+                              masculine_coded_words[masc_start:],
+                              feminine_coded_words[fem_start:])
+            results.append(result)
+            if timed:
+                times["match"] += perf_counter() - start
+
+        num_masculine_words.append(num_masc)
+        num_feminine_words.append(num_fem)
+        masculine_offsets.append(len(masculine_coded_words))
+        feminine_offsets.append(len(feminine_coded_words))
+
+    if timed:
+        del times["result"]
+        _record(times, num_ads, num_tokens, len(masculine_coded_words),
+                len(feminine_coded_words))
+    batch = {"result": results,
+             "num_masculine_words": num_masculine_words,
+             "num_feminine_words": num_feminine_words,
+             "masculine_coded_words": masculine_coded_words,
+             "masculine_offsets": masculine_offsets,
+             "feminine_coded_words": feminine_coded_words,
+             "feminine_offsets": feminine_offsets,
+             "lexicon": lexicon.key
+             }
+    if skip:
+        batch["index"] = kept
+    return batch
+
+
+def assess_categories(ad_text, lexicon_ids=None):
+    '''
+    Collects the coded words of every coding of several lexicons in a single
+    pass over the ad's tokens.
+
+    lexicon_ids - Ids of the lexicons to use (default: [lexicons.DEFAULT]).
+
+    Returns a dict with "words" and "counts" per category, where categories
+    are named "<lexicon id>:<coding>", and the "lexicons" keys used.
+    '''
+    if not isinstance(ad_text, str):
+        raise invalid_ad(ad_text)
+    lexicon_ids = lexicon_ids or [lexicons.DEFAULT]
+    matcher = lexicons.combined_matcher(lexicon_ids)
+    words = matcher.find(tokenize(ad_text))
+    return {"words": words,
+            "counts": {category: len(found) for category, found in words.items()},
+            "lexicons": [lexicons.get(lexicon).key for lexicon in lexicon_ids]}
+
+
+def batch_to_frame(batch, index=None):
+    '''
+    Turns the columns returned by assess_many() into a pandas DataFrame with
+    the same columns assess() results expand to, plus the word counts.
+
+    index - Optional index for the DataFrame, e.g. that of the input Series.
+            For a batch scored with on_error="skip", the index of all the
+            input ads; the rows kept are picked out of it.
+    '''
+    import pandas as pd
+
+    if "index" in batch:
+        index = (batch["index"] if index is None
+                 else pd.Index(index).take(batch["index"]))
+
+    def split(words, offsets):
+        return [words[start:end] for start, end in zip(offsets, offsets[1:])]
+
+    explanations = [None if result is None else explain(result, m, f)
+                    for result, m, f in zip(batch["result"],
+                                            batch["num_masculine_words"],
+                                            batch["num_feminine_words"])]
+    return pd.DataFrame({
+        "result": batch["result"],
+        "explanation": explanations,
+        "masculine_coded_words": split(batch["masculine_coded_words"],
+                                       batch["masculine_offsets"]),
+        "feminine_coded_words": split(batch["feminine_coded_words"],
+                                      batch["feminine_offsets"]),
+        "num_masculine_words": batch["num_masculine_words"],
+        "num_feminine_words": batch["num_feminine_words"],
+        "lexicon": batch["lexicon"],
+    }, index=index)
@@ -0,0 +1,147 @@
+import hashlib
+import json
+from collections import OrderedDict
+
+from . import instrument
+from . import lexicons
+from .assess import assess, assess_tokens, explain
+from .normalize import tokenize
+
+
+class ResultCache:
+    '''
+    Caches assess() results by a hash of the ad's tokens and the lexicon id
+    and version, so repeated job ads are only scored once and results are
+    never reused after the lexicon's stems change.
+
+    Results are kept in memory in LRU order, and optionally also in a SQLite
+    file so they survive between runs.
+
+    maxsize - Maximum number of results kept in memory.
+    path - Optional SQLite file to persist results to.
+    '''
+
+    def __init__(self, maxsize=10000, path=None):
+        self.maxsize = maxsize
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._results = OrderedDict()
+        self._db = None
+        self._unsaved = 0
+        if path is not None:
+            import sqlite3
+
+            self._db = sqlite3.connect(path, timeout=30)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("CREATE TABLE IF NOT EXISTS results "
+                             "(key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+            self._db.commit()
+
+    def key(self, tokens, lexicon=None):
+        '''
+        Returns the cache key for an ad's tokens scored with a lexicon
+        (default: lexicons.DEFAULT).
+        '''
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(lexicons.get(lexicon).key.encode("utf-8"))
+        digest.update(b"\0")
+        digest.update(" ".join(tokens).encode("ascii"))
+        return digest.hexdigest()
+
+    def get(self, key):
+        '''
+        Returns the cached (result, masculine_coded_words,
+        feminine_coded_words) for key, or None. Counts a hit or a miss.
+        '''
+        value = self._results.get(key)
+        if value is not None:
+            self._results.move_to_end(key)
+        elif self._db is not None:
+            row = self._db.execute("SELECT value FROM results WHERE key = ?",
+                                   (key,)).fetchone()
+            if row is not None:
+                value = tuple(json.loads(row[0]))
+                self._remember(key, value)
+
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        if instrument.enabled:
+            instrument.count("cache_misses" if value is None else "cache_hits")
+        return value
+
+    def put(self, key, result, masculine_coded_words, feminine_coded_words):
+        '''
+        Caches a result. Results written to the SQLite file are committed
+        every 1000 puts and on flush() / close().
+        '''
+        value = (result, masculine_coded_words, feminine_coded_words)
+        self._remember(key, value)
+        if self._db is not None:
+            self._db.execute("INSERT OR REPLACE INTO results VALUES (?, ?)",
+                             (key, json.dumps(value)))
+            self._unsaved += 1
+            if self._unsaved >= 1000:
+                self.flush()
+
+    def _remember(self, key, value):
+        self._results[key] = value
+        self._results.move_to_end(key)
+        if len(self._results) > self.maxsize:
+            self._results.popitem(last=False)
+
+    def assess(self, ad_text, lexicon=None):
+        '''
+        Same as genderdecoder.assess(), answered from the cache when the ad
+        has been seen before.
+        '''
+        if not isinstance(ad_text, str):
+            return assess(ad_text, lexicon=lexicon)
+
+        lexicon = lexicons.get(lexicon)
+        tokens = tokenize(ad_text)
+        key = self.key(tokens, lexicon)
+        value = self.get(key)
+        if value is None:
+            res = assess_tokens(tokens, lexicon)
+            self.put(key, res["result"], res["masculine_coded_words"],
+                     res["feminine_coded_words"])
+            return res
+
+        result, masculine_coded_words, feminine_coded_words = value
+        return {"result": result,
+                "explanation": explain(result, len(masculine_coded_words),
+                                       len(feminine_coded_words)),
+                "masculine_coded_words": list(masculine_coded_words),
+                "feminine_coded_words": list(feminine_coded_words),
+                "lexicon": lexicon.key
+                }
+
+    def stats(self):
+        '''
+        Returns the hit and miss counters and the number of results in memory.
+        '''
+        lookups = self.hits + self.misses
+        return {"hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "size": len(self._results)}
+
+    def flush(self):
+        if self._db is not None:
+            self._db.commit()
+            self._unsaved = 0
+
+    def close(self):
+        if self._db is not None:
+            self.flush()
+            self._db.close()
+            self._db = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,288 @@
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+from . import lexicons
+from .aggregate import Aggregates
+from .assess import assess_many, batch_to_frame
+from .cache import ResultCache
+from .dedupe import NearDuplicateIndex
+from .errors import GenderDecoderError, check_on_error, raise_first
+from .results import (RESULT_COLUMNS, UNSTORED_COLUMNS, concat_tables,
+                      to_table, write_results)
+
+TEXT_COLUMN = "description"
+CHUNKSIZE = 1000
+
+# The result cache and lexicon of a worker process.
+_worker_cache = None
+_worker_lexicon = None
+
+
+def default_workers():
+    '''
+    Returns the number of worker processes to use: one per available core.
+    '''
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def _init_worker(cache_path, lexicon):
+    global _worker_cache, _worker_lexicon
+    if cache_path is not None:
+        _worker_cache = ResultCache(path=cache_path)
+    # Loads the lexicon (and builds the matcher assess_many() uses) once per
+    # worker
+    _worker_lexicon = lexicons.get(lexicon)
+    _worker_lexicon.combined_matcher()
+
+
+def make_executor(workers=None, cache_path=None, lexicon=None):
+    '''
+    Returns a ProcessPoolExecutor for score_chunk().
+
+    cache_path - Optional SQLite file each worker keeps a ResultCache in.
+    lexicon - Id of (or path to) the lexicon the workers score with.
+    '''
+    return ProcessPoolExecutor(max_workers=workers or default_workers(),
+                               initializer=_init_worker,
+                               initargs=(cache_path, lexicon))
+
+
+def score_chunk(texts, on_error="mark"):
+    '''
+    Scores a list of texts with assess_many(), using the worker's cache and
+    lexicon. The ErrorRecords of ads that could not be scored are returned
+    under "errors", and the worker's cache hits and misses for these texts
+    under "cache_hits" and "cache_misses".
+    '''
+    errors = []
+    hits = misses = 0
+    if _worker_cache is not None:
+        hits, misses = _worker_cache.hits, _worker_cache.misses
+    batch = assess_many(texts, cache=_worker_cache, lexicon=_worker_lexicon,
+                        on_error=on_error, errors=errors)
+    batch["errors"] = errors
+    batch["cache_hits"] = batch["cache_misses"] = 0
+    if _worker_cache is not None:
+        _worker_cache.flush()
+        batch["cache_hits"] = _worker_cache.hits - hits
+        batch["cache_misses"] = _worker_cache.misses - misses
+    return batch
+
+
+def add_cache_stats(cache_stats, batch):
+    '''
+    Adds the cache hits and misses of a batch from score_chunk() to a dict of
+    "hits" and "misses" totals, if there is one.
+    '''
+    if cache_stats is not None:
+        cache_stats["hits"] = cache_stats.get("hits", 0) + batch["cache_hits"]
+        cache_stats["misses"] = (cache_stats.get("misses", 0) +
+                                 batch["cache_misses"])
+
+
+def split_chunks(texts, chunksize):
+    '''
+    Splits a sequence of texts into lists of at most chunksize texts.
+    '''
+    texts = list(texts)
+    return [texts[start:start + chunksize]
+            for start in range(0, len(texts), chunksize)]
+
+
+def map_ordered(executor, func, items, max_pending):
+    '''
+    Like executor.map(), but submits lazily so at most max_pending items are
+    queued or running at once. Results are yielded in input order.
+    '''
+    pending = deque()
+    for item in items:
+        pending.append(executor.submit(func, item))
+        if len(pending) >= max_pending:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def score_frame(df, text_column=TEXT_COLUMN, executor=None, workers=None,
+                chunksize=CHUNKSIZE, cache_path=None, lexicon=None,
+                on_error="mark", errors=None, cache_stats=None):
+    '''
+    Scores the text column of a DataFrame on a process pool and returns the
+    DataFrame with the assess() result columns and word counts added
+    (replacing any previous results).
+
+    workers - Number of worker processes (default: one per core).
+    executor - An existing executor from make_executor() with that many
+               workers to use instead of starting a new one.
+    cache_path - Optional SQLite file to cache results in (see ResultCache).
+    lexicon - Id of (or path to) the lexicon to score with.
+    on_error - What to do with rows whose text is not a string: "mark" them
+               with a result of None, "skip" (drop) them, or "raise"
+               InvalidAdError. See assess_many().
+    errors - Optional list to append an ErrorRecord to for each row marked or
+             skipped, indexed by its position in df.
+    cache_stats - Optional dict to add the cache's "hits" and "misses" to.
+    '''
+    import pandas as pd
+
+    if text_column not in df:
+        raise ValueError(f"No '{text_column}' column to score")
+    check_on_error(on_error)
+
+    workers = workers or default_workers()
+    own_executor = executor is None
+    if own_executor:
+        executor = make_executor(workers, cache_path, lexicon)
+    try:
+        # With on_error="raise", errors are marked by the workers and raised
+        # here, where their positions in df are known.
+        batches = map_ordered(executor,
+                              partial(score_chunk,
+                                      on_error=("mark" if on_error == "raise"
+                                                else on_error)),
+                              split_chunks(df[text_column], chunksize),
+                              2 * workers)
+        frames = []
+        for start, batch in zip(range(0, len(df), chunksize), batches):
+            # Indexed by position in df
+            frames.append(batch_to_frame(
+                batch, index=pd.RangeIndex(start, min(start + chunksize,
+                                                      len(df)))))
+            records = [record._replace(index=start + record.index)
+                       for record in batch["errors"]]
+            if on_error == "raise":
+                raise_first(records)
+            if errors is not None:
+                errors.extend(records)
+            add_cache_stats(cache_stats, batch)
+        res_df = pd.concat(frames)
+    finally:
+        if own_executor:
+            executor.shutdown()
+
+    if on_error == "skip":
+        df = df.iloc[res_df.index]
+    res_df.index = df.index
+    return pd.concat([df.drop(res_df.columns, axis=1, errors="ignore"),
+                      res_df], axis=1)
+
+
+def score_csvs(paths, output, text_column=TEXT_COLUMN, workers=None,
+               chunksize=CHUNKSIZE, cache_path=None, aggregates_path=None,
+               group_column=None, lexicon=None, on_error="mark", errors=None,
+               results_path=None, dedupe=None, weight_duplicates=False,
+               cache_stats=None):
+    '''
+    Scores one or more CSVs of job ads and writes them, with their results,
+    to a single output CSV. Returns the number of rows written.
+
+    Rows are written with the columns of the first CSV; columns that only
+    appear in later CSVs are dropped.
+
+    paths - The CSVs to read.
+    output - The CSV to write.
+    text_column - The column holding the job descriptions.
+    cache_path - Optional SQLite file to cache results in (see ResultCache).
+    aggregates_path - Optional JSON file of Aggregates to add the scored ads
+                      to (created if missing).
+    group_column - The column to group the aggregates by.
+    lexicon - Id of (or path to) the lexicon to score with.
+    on_error - See score_frame().
+    errors - Optional list to append an ErrorRecord to for each row marked or
+             skipped, with the CSV it came from as its source.
+    results_path - Optional file to also write the results to in the compact
+                   format of write_results(), with every column but the
+                   descriptions, and their tokens for rescore().
+    dedupe - Optional similarity threshold (e.g. 0.8) at which ads are
+             near-duplicates (see NearDuplicateIndex). Only the first ad of
+             each cluster, across all the CSVs, is scored and written, with
+             the size of its cluster in a "cluster_size" column.
+    weight_duplicates - With dedupe, count each ad in the aggregates once per
+                        ad in its cluster, rather than once.
+    cache_stats - Optional dict to add the cache's "hits" and "misses" to.
+    '''
+    import pandas as pd
+
+    labels = sizes = None
+    if dedupe is not None:
+        labels, sizes = _cluster_csvs(paths, text_column, dedupe)
+
+    aggregates = None
+    if aggregates_path is not None:
+        aggregates = Aggregates.load(aggregates_path, missing_ok=True,
+                                     lexicon=lexicon)
+
+    rows = 0
+    columns = None
+    tables = []
+    workers = workers or default_workers()
+    # Position of the first row of the current CSV across all of them
+    start = 0
+    with make_executor(workers, cache_path, lexicon) as executor:
+        for path in paths:
+            df = pd.read_csv(path)
+            if labels is not None:
+                end = start + len(df)
+                df["cluster_size"] = sizes[start:end]
+                df = df[[label == row for row, label
+                         in enumerate(labels[start:end], start)]]
+                start = end
+            # Row numbers in the CSV, for the error records
+            row_numbers = df.index
+            file_errors = []
+            try:
+                df = score_frame(df, text_column, workers=workers,
+                                 executor=executor, chunksize=chunksize,
+                                 on_error=on_error, errors=file_errors,
+                                 cache_stats=cache_stats)
+            except (GenderDecoderError, ValueError) as e:
+                raise type(e)(f"{path}: {e}") from None
+            if errors is not None:
+                errors.extend(record._replace(
+                                  index=int(row_numbers[record.index]),
+                                  source=path)
+                              for record in file_errors)
+            if columns is None:
+                columns = df.columns
+                df.to_csv(output, index=False)
+            else:
+                df.reindex(columns=columns).to_csv(output, index=False,
+                                                   mode="a", header=False)
+            if aggregates is not None:
+                aggregates.add_frame(df, group_column,
+                                     "cluster_size" if weight_duplicates
+                                     else None)
+            if results_path is not None:
+                tables.append(to_table(
+                    df.reindex(columns=columns), lexicon,
+                    [column for column in columns
+                     if column != text_column and column not in
+                     RESULT_COLUMNS + UNSTORED_COLUMNS],
+                    texts=df[text_column]))
+            rows += len(df)
+
+    if aggregates is not None:
+        aggregates.save(aggregates_path)
+    if tables:
+        write_results(results_path, concat_tables(tables))
+    return rows
+
+
+def _cluster_csvs(paths, text_column, threshold):
+    # Near-duplicate clusters of the ads of all the CSVs, in order
+    import pandas as pd
+
+    index = NearDuplicateIndex(threshold)
+    for path in paths:
+        try:
+            texts = pd.read_csv(path, usecols=[text_column])[text_column]
+        except ValueError:
+            raise ValueError(f"{path}: No '{text_column}' column to score") \
+                from None
+        index.add_many(texts)
+    return index.labels(), index.cluster_sizes()
@@ -0,0 +1,222 @@
+import hashlib
+import zlib
+
+from .normalize import tokenize
+
+THRESHOLD = 0.8
+NUM_PERM = 128
+SHINGLE_SIZE = 5
+
+
+# Odd multiplier combining the hashes of a shingle's words
+_MIX = 0x9E3779B97F4A7C15
+
+
+def shingle_hashes(ad_text, size=SHINGLE_SIZE, word_hashes=None):
+    '''
+    Returns a NumPy array of 64-bit hashes of the ad's runs of size
+    consecutive words (its shingles), or of its words if it has fewer than
+    size. Word runs, rather than words, make ads with the same vocabulary in
+    a different order look different. Hashes may repeat.
+
+    word_hashes - Optional dict to memoize the hash of each word in, shared
+                  between calls since ads share most of their words.
+    '''
+    import numpy as np
+
+    if word_hashes is None:
+        word_hashes = {}
+    hashes = []
+    for token in tokenize(ad_text):
+        value = word_hashes.get(token)
+        if value is None:
+            # crc32 rather than hash(), which differs between processes
+            value = word_hashes[token] = (zlib.crc32(token.encode("ascii")) |
+                                          (len(token) << 32))
+        hashes.append(value)
+    words = np.array(hashes, dtype=np.uint64)
+    if len(words) < size:
+        return words
+    count = len(words) - size + 1
+    shingles = np.zeros(count, dtype=np.uint64)
+    with np.errstate(over="ignore"):
+        for offset in range(size):
+            shingles = shingles * np.uint64(_MIX) + words[offset:offset + count]
+    return shingles
+
+
+def lsh_bands(threshold, num_perm):
+    '''
+    Returns the (bands, rows) split of num_perm MinHash values whose LSH
+    S-curve, (1 / bands) ** (1 / rows), is closest to threshold: ads about
+    that similar have even odds of sharing a band.
+    '''
+    splits = [(num_perm // rows, rows) for rows in range(1, num_perm + 1)
+              if num_perm % rows == 0]
+    return min(splits, key=lambda split:
+               abs((1 / split[0]) ** (1 / split[1]) - threshold))
+
+
+class NearDuplicateIndex:
+    '''
+    Finds job ads that are near-duplicates of earlier ones, e.g. reposts with
+    a new date or an added paragraph, in roughly linear time.
+
+    Each ad's word shingles get a MinHash signature of num_perm values, cut
+    into bands. Ads sharing any band are candidates, and candidates whose
+    signatures agree on at least threshold of their values (an estimate of
+    the Jaccard similarity of their shingles) are put in the same cluster.
+    Clusters are labelled by their first ad.
+
+    threshold - Estimated Jaccard similarity at which ads are duplicates.
+    num_perm - Number of MinHash values per ad.
+    shingle_size - Number of words per shingle.
+    seed - Seed of the MinHash hash functions. Indexes with the same
+           settings and seed give the same signatures.
+    '''
+
+    def __init__(self, threshold=THRESHOLD, num_perm=NUM_PERM,
+                 shingle_size=SHINGLE_SIZE, seed=1):
+        import numpy as np
+
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        self.bands, self.rows = lsh_bands(threshold, num_perm)
+        # Multiply-shift hashes ((a * x + b) mod 2**64) >> 32, with odd a
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(1, 2**63, num_perm, dtype=np.uint64) | 1
+        self._b = rng.integers(0, 2**63, num_perm, dtype=np.uint64)
+        self._buckets = [{} for _ in range(self.bands)]
+        self._word_hashes = {}
+        # Exact reposts are found by a hash of their text, without MinHash
+        self._texts = {}
+        self._signatures = []
+        # Union-find parents; a root is the first ad of its cluster
+        self._parents = []
+
+    def __len__(self):
+        return len(self._parents)
+
+    def signature(self, ad_text):
+        '''
+        Returns the MinHash signature of an ad, or None if it has no words.
+        '''
+        import numpy as np
+
+        hashes = shingle_hashes(ad_text, self.shingle_size, self._word_hashes)
+        if not len(hashes):
+            return None
+        with np.errstate(over="ignore"):
+            values = (hashes[:, None] * self._a + self._b) >> np.uint64(32)
+        return values.min(axis=0).astype(np.uint32)
+
+    def add(self, ad_text):
+        '''
+        Adds an ad and returns its id (its position in the index). Ads that
+        are not strings or have no words are never duplicates.
+        '''
+        ad_id = len(self._parents)
+        self._parents.append(ad_id)
+        if not isinstance(ad_text, str):
+            self._signatures.append(None)
+            return ad_id
+
+        digest = hashlib.blake2b(ad_text.encode("utf-8"),
+                                 digest_size=16).digest()
+        same = self._texts.get(digest)
+        if same is not None:
+            self._signatures.append(self._signatures[same])
+            self._parents[ad_id] = self._find(same)
+            return ad_id
+        self._texts[digest] = ad_id
+
+        signature = self.signature(ad_text)
+        self._signatures.append(signature)
+        if signature is None:
+            return ad_id
+
+        rows = self.rows
+        for band, buckets in enumerate(self._buckets):
+            key = signature[band * rows:(band + 1) * rows].tobytes()
+            candidates = buckets.get(key)
+            if candidates is None:
+                buckets[key] = [ad_id]
+                continue
+            # A bucket keeps one ad per cluster, so reposts of the same ad
+            # don't make it grow.
+            merged = False
+            for other in candidates:
+                if self._find(other) == self._find(ad_id):
+                    merged = True
+                elif self.similarity(ad_id, other) >= self.threshold:
+                    self._union(other, ad_id)
+                    merged = True
+            if not merged:
+                candidates.append(ad_id)
+        return ad_id
+
+    def add_many(self, texts):
+        '''
+        Adds ads and returns their ids.
+        '''
+        return [self.add(ad_text) for ad_text in texts]
+
+    def similarity(self, a, b):
+        '''
+        Returns the estimated Jaccard similarity of two ads in the index.
+        '''
+        sig_a = self._signatures[a]
+        sig_b = self._signatures[b]
+        if sig_a is None or sig_b is None:
+            return 0.0
+        return float((sig_a == sig_b).mean())
+
+    def _find(self, ad_id):
+        parents = self._parents
+        root = ad_id
+        while parents[root] != root:
+            root = parents[root]
+        # Point everything on the path straight at the root
+        while parents[ad_id] != root:
+            parents[ad_id], ad_id = root, parents[ad_id]
+        return root
+
+    def _union(self, a, b):
+        root_a = self._find(a)
+        root_b = self._find(b)
+        # The earlier ad stays the representative
+        if root_a < root_b:
+            self._parents[root_b] = root_a
+        elif root_b < root_a:
+            self._parents[root_a] = root_b
+
+    def labels(self):
+        '''
+        Returns the cluster of every ad, as the id of its first ad. An ad is
+        the representative of its cluster if its label is its own id.
+        '''
+        return [self._find(ad_id) for ad_id in range(len(self._parents))]
+
+    def cluster_sizes(self):
+        '''
+        Returns the size of every ad's cluster.
+        '''
+        labels = self.labels()
+        sizes = {}
+        for label in labels:
+            sizes[label] = sizes.get(label, 0) + 1
+        return [sizes[label] for label in labels]
+
+
+def find_near_duplicates(texts, threshold=THRESHOLD, num_perm=NUM_PERM,
+                         shingle_size=SHINGLE_SIZE):
+    '''
+    Clusters near-duplicate job ads. Returns (labels, sizes): for each ad, the
+    position of the first ad of its cluster and the size of its cluster.
+    Score only the ads whose label is their own position, and weight them by
+    their cluster's size where reposts should still count.
+    '''
+    index = NearDuplicateIndex(threshold, num_perm, shingle_size)
+    index.add_many(texts)
+    return index.labels(), index.cluster_sizes()
@@ -0,0 +1,62 @@
+from collections import namedtuple
+
+# What the batch functions do with an ad they can't score:
+#   mark - keep its row, with a result of None (the default)
+#   skip - leave its row out of the output
+#   raise - stop and raise the error
+ON_ERROR = ("mark", "skip", "raise")
+
+# An ad a batch function could not score: its position in the input, the
+# error's class name and message, and the file it came from, if any.
+ErrorRecord = namedtuple("ErrorRecord",
+                         ["index", "error", "message", "source"],
+                         defaults=[None])
+
+
+class GenderDecoderError(Exception):
+    '''
+    Base class of the errors genderdecoder raises.
+    '''
+
+
+class InvalidAdError(GenderDecoderError, TypeError):
+    '''
+    A job ad that is not a string, e.g. None or a NaN from an empty
+    pandas cell.
+    '''
+
+
+class UnknownLexiconError(GenderDecoderError, KeyError):
+    '''
+    A lexicon id that is neither registered, shipped nor a JSON file.
+    '''
+
+    def __str__(self):
+        # KeyError would quote the message
+        return self.args[0]
+
+
+def check_on_error(on_error):
+    if on_error not in ON_ERROR:
+        raise ValueError(f"on_error must be one of {', '.join(ON_ERROR)}, "
+                         f"not {on_error!r}")
+
+
+def invalid_ad(ad_text, index=None):
+    '''
+    Returns the InvalidAdError for an ad that is not a string.
+    '''
+    where = "Job ad" if index is None else f"Job ad {index}"
+    return InvalidAdError(f"{where} is {ad_text!r} "
+                          f"({type(ad_text).__name__}), not a string")
+
+
+def raise_first(errors, where=""):
+    '''
+    Raises the error of the first ErrorRecord in errors, if there is one.
+    Used with on_error="raise" by the functions that score chunks of ads
+    on worker processes, which mark errors so their positions are known.
+    '''
+    if errors:
+        record = errors[0]
+        raise InvalidAdError(f"{where}row {record.index}: {record.message}")
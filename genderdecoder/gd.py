@@ -1,3 +1,28 @@
+from .aggregate import Aggregates
 from .assess import assess
+from .assess import assess_categories
+from .assess import assess_counts
+from .assess import assess_counts_many
+from .assess import assess_many
+from .assess import assess_tokens
+from .assess import batch_to_frame
+from .cache import ResultCache
+from .dedupe import NearDuplicateIndex
+from .dedupe import find_near_duplicates
+from .errors import ErrorRecord
+from .errors import GenderDecoderError
+from .errors import InvalidAdError
+from .errors import UnknownLexiconError
+from .index import InvertedIndex
+from .lexicons import Lexicon
+from .normalize import normalize
+from .normalize import tokenize
+from .normalize import tokenize_many
+from .rescore import rescore_results
+from .results import read_results
+from .results import stem_counts
+from .results import to_table
+from .results import write_results
+from .rollup import Rollup
 from .wordlists import feminine_coded_words
-from .wordlists import masculine_coded_words
\ No newline at end of file
+from .wordlists import masculine_coded_words
@@ -0,0 +1,269 @@
+import itertools
+import os
+
+from . import lexicons
+from .lexicons import CODINGS
+
+# Written to the schema metadata, so readers can tell what they're reading.
+FORMAT = "genderdecoder-index/1"
+# Columns indexed by their values, besides the stems of each coding
+FIELDS = ("company_name", "query")
+
+
+def _stem_postings(df, coding, lexicon):
+    # (stem, ad) pairs for every stem of a coding matched in each ad, from
+    # its stem list if it has one, else by matching its coded words
+    import numpy as np
+    import pandas as pd
+
+    from_stems = f"{coding}_stems" in df
+    lists = [ad_list if isinstance(ad_list, (list, tuple))
+             or hasattr(ad_list, "__array__") else ()
+             for ad_list in df[f"{coding}_stems" if from_stems
+                               else f"{coding}_coded_words"]]
+    lengths = np.fromiter(map(len, lists), dtype=np.int64, count=len(lists))
+    ads = np.repeat(np.arange(len(lists)), lengths)
+    codes, words = pd.factorize(
+        np.array(list(itertools.chain.from_iterable(lists)), dtype=object),
+        sort=from_stems)
+    if from_stems:
+        return list(words), codes, ads
+
+    # Each distinct word is matched once; a word matching k stems gives k
+    # pairs for each ad it is in
+    matcher = lexicon.matcher(coding)
+    word_stems = [matcher.match(word) for word in words]
+    stems = sorted({stem for hits in word_stems for stem in hits})
+    ids = {stem: i for i, stem in enumerate(stems)}
+    pair_words, pair_stems = [], []
+    for word, hits in enumerate(word_stems):
+        for stem in set(hits):
+            pair_words.append(word)
+            pair_stems.append(ids[stem])
+    pair_words = np.array(pair_words, dtype=np.int64)
+    pair_stems = np.array(pair_stems, dtype=np.int64)
+    # For each word, the range of its pairs
+    order = np.argsort(pair_words, kind="stable")
+    pair_words, pair_stems = pair_words[order], pair_stems[order]
+    starts = np.searchsorted(pair_words, np.arange(len(words)))
+    repeats = np.bincount(pair_words, minlength=len(words))[codes]
+    offsets = (np.arange(repeats.sum()) -
+               np.repeat(np.cumsum(repeats) - repeats, repeats))
+    return (stems, pair_stems[np.repeat(starts[codes], repeats) + offsets],
+            np.repeat(ads, repeats))
+
+
+class InvertedIndex:
+    '''
+    Maps the companies, queries and matched stems of a dataset's ads to the
+    ids (row positions) of the ads that have them, so filters and
+    co-occurrence counts don't have to scan every ad.
+
+    Each field's postings are stored like an Arrow list column: one sorted
+    int32 array of ad ids for all its keys, plus the offset where each key's
+    ids start. Fields are named after their columns, and stems of a coding
+    are under "masculine_stems" and "feminine_stems".
+
+    Build one with InvertedIndex.build(df), save() it beside the dataset and
+    load() it back, memory-mapped. The index records the key of the lexicon
+    and, if given, a fingerprint of the dataset it was built from, so a
+    reader can tell it belongs to the dataset it is used with.
+    '''
+
+    def __init__(self, postings, num_ads, lexicon=None, dataset=None):
+        # postings - Dict of field -> (keys, offsets, ids)
+        self.num_ads = num_ads
+        self.lexicon = lexicon
+        self.dataset = dataset
+        self._postings = postings
+        self._rows = {field: {key: row for row, key in enumerate(keys)}
+                      for field, (keys, _, _) in postings.items()}
+
+    @classmethod
+    def build(cls, df, fields=FIELDS, lexicon=None, dataset=None):
+        '''
+        Indexes the ads of a DataFrame with coded word (or stem) lists, e.g.
+        the dataset, by their position in it. Fields missing from df are
+        skipped.
+
+        lexicon - The lexicon the ads were scored with, to map coded words to
+                  stems.
+        dataset - Optional fingerprint of df to record, e.g. from
+                  dataset.fingerprint().
+        '''
+        import numpy as np
+        import pandas as pd
+
+        lexicon = lexicons.get(lexicon)
+        num_ads = len(df)
+        postings = {}
+        for field in fields:
+            if field not in df:
+                continue
+            codes, keys = pd.factorize(df[field], sort=True)
+            ads = np.arange(num_ads)
+            known = codes >= 0
+            postings[field] = cls._pack(list(keys.astype(str)), codes[known],
+                                        ads[known])
+        for coding in CODINGS:
+            stems, codes, ads = _stem_postings(df, coding, lexicon)
+            postings[f"{coding}_stems"] = cls._pack(stems, codes, ads)
+        return cls(postings, num_ads, lexicon.key, dataset)
+
+    @staticmethod
+    def _pack(keys, codes, ads):
+        # Sorted, distinct ad ids per key, as (keys, offsets, ids)
+        import numpy as np
+
+        pairs = np.unique(np.asarray(codes, dtype=np.int64) * (len(ads) + 1)
+                          + np.asarray(ads, dtype=np.int64))
+        key_of = pairs // (len(ads) + 1)
+        ids = (pairs % (len(ads) + 1)).astype(np.int32)
+        offsets = np.zeros(len(keys) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(key_of, minlength=len(keys)), out=offsets[1:])
+        return list(keys), offsets, ids
+
+    @property
+    def fields(self):
+        return list(self._postings)
+
+    def keys(self, field):
+        '''
+        Returns the keys of a field in sorted order, e.g. every company.
+        '''
+        return list(self._postings[field][0])
+
+    def counts(self, field):
+        '''
+        Returns the number of ads with each key of a field, as a dict.
+        '''
+        import numpy as np
+
+        keys, offsets, _ = self._postings[field]
+        return dict(zip(keys, np.diff(offsets).tolist()))
+
+    def ids(self, field, key):
+        '''
+        Returns the sorted ids of the ads with a key, e.g.
+        ids("masculine_stems", "compet"), as a read-only NumPy array (empty
+        for an unknown key).
+        '''
+        import numpy as np
+
+        _, offsets, ids = self._postings[field]
+        row = self._rows[field].get(key)
+        if row is None:
+            return np.array([], dtype=np.int32)
+        return ids[offsets[row]:offsets[row + 1]]
+
+    def any_of(self, field, keys):
+        '''
+        Returns the sorted ids of the ads with any of the keys.
+        '''
+        import numpy as np
+
+        arrays = [self.ids(field, key) for key in keys]
+        if not arrays:
+            return np.array([], dtype=np.int32)
+        if len(arrays) == 1:
+            return arrays[0]
+        return np.unique(np.concatenate(arrays))
+
+    def filter(self, filters, ids=None):
+        '''
+        Returns the sorted ids of the ads matching every field of filters, a
+        dict of field -> keys, where an ad matches a field if it has any of
+        its keys. Fields with no keys are ignored.
+
+        ids - Optional sorted ids to narrow down (default: every ad).
+        '''
+        import numpy as np
+
+        # Smallest first, so each intersection is as cheap as possible
+        matches = sorted((self.any_of(field, keys)
+                          for field, keys in filters.items() if keys), key=len)
+        if ids is None:
+            if not matches:
+                return np.arange(self.num_ads, dtype=np.int32)
+            ids, matches = matches[0], matches[1:]
+        for match in matches:
+            ids = np.intersect1d(ids, match, assume_unique=True)
+        return ids
+
+    def cooccurrence(self, field, ids, top=None):
+        '''
+        Returns how many of the ads ids have each key of a field, as
+        (key, count) pairs, most common first, without keys none of them have.
+        E.g. the stems most used alongside "compet" are
+        cooccurrence("feminine_stems", ids("masculine_stems", "compet")).
+        '''
+        import numpy as np
+
+        keys, offsets, postings = self._postings[field]
+        selected = np.zeros(self.num_ads, dtype=bool)
+        selected[ids] = True
+        hits = np.concatenate([[0], np.cumsum(selected[postings])])
+        counts = hits[offsets[1:]] - hits[offsets[:-1]]
+        order = np.lexsort((np.arange(len(keys)), -counts))
+        order = order[counts[order] > 0][:top]
+        return [(keys[i], int(counts[i])) for i in order]
+
+    def save(self, path):
+        '''
+        Writes the index to an Arrow IPC file, atomically, with one row per
+        (field, key) and its ids as a list.
+        '''
+        import numpy as np
+        import pyarrow as pa
+
+        fields, keys, offsets, ids = [], [], [0], []
+        for field, (field_keys, field_offsets, field_ids) in \
+                self._postings.items():
+            fields.extend([field] * len(field_keys))
+            keys.extend(field_keys)
+            offsets.extend((field_offsets[1:] + offsets[-1]).tolist())
+            ids.append(field_ids)
+        ids = np.concatenate(ids) if ids else np.array([], dtype=np.int32)
+        table = pa.table({
+            "field": pa.array(fields, type=pa.string()).dictionary_encode(),
+            "key": pa.array(keys, type=pa.string()),
+            "ids": pa.ListArray.from_arrays(
+                pa.array(offsets, type=pa.int32()),
+                pa.array(ids, type=pa.int32()))})
+        table = table.replace_schema_metadata({
+            "format": FORMAT, "num_ads": str(self.num_ads),
+            "lexicon": self.lexicon or "", "dataset": self.dataset or ""})
+        tmp = f"{path}.tmp"
+        with pa.OSFile(tmp, "wb") as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path):
+        '''
+        Reads an index written by save(). The ids are memory-mapped, not
+        copied.
+        '''
+        import numpy as np
+        import pyarrow as pa
+
+        table = pa.ipc.open_file(pa.memory_map(path)).read_all()
+        meta = table.schema.metadata
+        if meta.get(b"format") != FORMAT.encode("ascii"):
+            raise ValueError(f"{path} is not a {FORMAT} file")
+        lists = table["ids"].combine_chunks()
+        offsets = lists.offsets.to_numpy().astype(np.int64)
+        ids = lists.values.to_numpy()
+        postings = {}
+        fields = table["field"].to_pylist()
+        keys = table["key"].to_pylist()
+        start = 0
+        for field, group in itertools.groupby(fields):
+            end = start + len(list(group))
+            postings[field] = (keys[start:end], offsets[start:end + 1] -
+                               offsets[start], ids[offsets[start]:offsets[end]])
+            start = end
+        return cls(postings, int(meta[b"num_ads"]),
+                   meta[b"lexicon"].decode("utf-8") or None,
+                   meta.get(b"dataset", b"").decode("utf-8") or None)
@@ -0,0 +1,180 @@
+import atexit
+import os
+import sys
+import threading
+from collections import Counter
+
+# Set to anything but "" or "0" to turn on the stage timers and counters.
+STATS_ENV = "GENDERDECODER_STATS"
+# Set to a file path to sample the stacks of every thread while the program
+# runs and write them there, in collapsed-stack format, when it exits.
+PROFILE_ENV = "GENDERDECODER_PROFILE"
+
+# Stages of scoring an ad, in order.
+STAGES = ("normalize", "tokenize", "match", "result")
+
+# Checked by the scoring functions before they time anything, so turning
+# instrumentation off costs one attribute lookup per call.
+enabled = os.environ.get(STATS_ENV, "") not in ("", "0")
+
+_lock = threading.Lock()
+_calls = Counter()
+_seconds = Counter()
+_counters = Counter()
+
+
+def enable(on=True):
+    '''
+    Turns the stage timers and counters on (or off).
+    '''
+    global enabled
+    enabled = on
+
+
+def add_time(stage, seconds, calls=1):
+    '''
+    Adds time spent in a stage. Only called while enabled.
+    '''
+    with _lock:
+        _calls[stage] += calls
+        _seconds[stage] += seconds
+
+
+def count(name, n=1):
+    '''
+    Adds n to a counter, e.g. "tokens" or "cache_hits". Only called while
+    enabled.
+    '''
+    with _lock:
+        _counters[name] += n
+
+
+def reset():
+    '''
+    Zeroes every timer and counter.
+    '''
+    with _lock:
+        _calls.clear()
+        _seconds.clear()
+        _counters.clear()
+
+
+def stats():
+    '''
+    Returns the timers and counters as a dict:
+
+        stages - stage -> {"calls": n, "seconds": total}
+        counters - name -> total, e.g. ads, tokens, masculine_matches,
+                   feminine_matches, cache_hits, cache_misses
+    '''
+    with _lock:
+        return {"enabled": enabled,
+                "stages": {stage: {"calls": _calls[stage],
+                                   "seconds": _seconds[stage]}
+                           for stage in sorted(_calls, key=_stage_order)},
+                "counters": dict(sorted(_counters.items()))}
+
+
+def _stage_order(stage):
+    return (STAGES.index(stage) if stage in STAGES else len(STAGES), stage)
+
+
+def prometheus(prefix="genderdecoder"):
+    '''
+    Returns the timers and counters in the Prometheus text exposition format.
+    '''
+    current = stats()
+    lines = [f"# HELP {prefix}_stage_seconds_total Time spent in each "
+             "scoring stage.",
+             f"# TYPE {prefix}_stage_seconds_total counter"]
+    for stage, timer in current["stages"].items():
+        lines.append(f'{prefix}_stage_seconds_total{{stage="{stage}"}} '
+                     f'{timer["seconds"]:.9f}')
+    lines += [f"# HELP {prefix}_stage_calls_total Times each scoring stage "
+              "ran.",
+              f"# TYPE {prefix}_stage_calls_total counter"]
+    for stage, timer in current["stages"].items():
+        lines.append(f'{prefix}_stage_calls_total{{stage="{stage}"}} '
+                     f'{timer["calls"]}')
+    for name, value in current["counters"].items():
+        lines += [f"# TYPE {prefix}_{name}_total counter",
+                  f"{prefix}_{name}_total {value}"]
+    return "\n".join(lines) + "\n"
+
+
+class SamplingProfiler:
+    '''
+    Samples the Python stacks of all other threads every interval seconds,
+    from a background thread, using sys._current_frames().
+
+    Samples are kept as collapsed stacks ("outer;inner;innermost" -> count),
+    the input format of flame graph tools.
+    '''
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.samples = Counter()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True,
+                                        name="genderdecoder-profiler")
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} "
+                                 f"({os.path.basename(code.co_filename)}"
+                                 f":{code.co_firstlineno})")
+                    frame = frame.f_back
+                self.samples[";".join(reversed(stack))] += 1
+
+    def collapsed(self):
+        '''
+        Returns the samples as collapsed-stack lines, most frequent first.
+        '''
+        return "".join(f"{stack} {n}\n"
+                       for stack, n in self.samples.most_common())
+
+    def write(self, path):
+        with open(path, "w") as f:
+            f.write(self.collapsed())
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def _profile_from_env():
+    path = os.environ.get(PROFILE_ENV)
+    if not path:
+        return None
+    profiler = SamplingProfiler().start()
+
+    def write():
+        profiler.stop()
+        profiler.write(path)
+    atexit.register(write)
+    return profiler
+
+
+# The profiler started by GENDERDECODER_PROFILE, if any.
+profiler = _profile_from_env()
@@ -0,0 +1,178 @@
+import glob
+import hashlib
+import json
+import os
+
+from . import wordlists
+from .errors import UnknownLexiconError
+from .matcher import CategoryMatcher, PrefixMatcher
+
+CODINGS = ("masculine", "feminine")
+DEFAULT = "gaucher"
+
+# Lexicon files shipped with the package, loaded the first time they're asked
+# for by id.
+DATA_DIR = os.path.join(os.path.dirname(__file__), "data")
+
+
+class Lexicon:
+    '''
+    A named set of coded stems for each coding, e.g. the word lists from
+    Gaucher, Friesen and Kay.
+
+    The version is a hash of the stems, so results and caches can record
+    exactly which stems produced them. Each coding's PrefixMatcher is built
+    the first time it's needed and then reused.
+
+    id - Short name used to look the lexicon up, e.g. "gaucher".
+    codings - Dict of coding ("masculine", "feminine") -> list of stems.
+    '''
+
+    def __init__(self, id, codings, description=""):
+        missing = [coding for coding in CODINGS if coding not in codings]
+        if missing:
+            raise ValueError(f"Lexicon '{id}' has no {', '.join(missing)} stems")
+        self.id = id
+        self.description = description
+        self.codings = {coding: tuple(stems) for coding, stems in codings.items()}
+        stems = json.dumps(self.codings, sort_keys=True)
+        self.version = hashlib.sha1(stems.encode("utf-8")).hexdigest()[:12]
+        self._matchers = {}
+        self._combined = None
+
+    @property
+    def key(self):
+        '''
+        The id and version, e.g. "gaucher@1a2b3c4d5e6f".
+        '''
+        return f"{self.id}@{self.version}"
+
+    def matcher(self, coding):
+        '''
+        Returns the PrefixMatcher for a coding's stems.
+        '''
+        matcher = self._matchers.get(coding)
+        if matcher is None:
+            matcher = self._matchers[coding] = PrefixMatcher(self.codings[coding])
+        return matcher
+
+    def combined_matcher(self):
+        '''
+        Returns a CategoryMatcher over all codings, so every coding is matched
+        in a single pass over the tokens.
+        '''
+        if self._combined is None:
+            self._combined = CategoryMatcher(self.codings)
+        return self._combined
+
+    @classmethod
+    def from_file(cls, path):
+        '''
+        Reads a lexicon from a JSON file of the form
+        {"id": ..., "description": ..., "codings": {coding: [stems]}}.
+        '''
+        with open(path) as f:
+            data = json.load(f)
+        return cls(data["id"], data["codings"], data.get("description", ""))
+
+    def __repr__(self):
+        return f"<Lexicon {self.key}>"
+
+
+_lexicons = {}
+# Lexicons loaded from files, by the real path of the file, so each file is
+# read and its matchers built only once.
+_files = {}
+
+
+def register(lexicon, replace=False):
+    '''
+    Makes a Lexicon available by its id. Registering the same stems under an
+    id again returns the Lexicon already registered, so its matchers are
+    kept.
+
+    replace - Replace a Lexicon registered under the same id with different
+              stems, instead of raising ValueError. Results already scored
+              with the old stems keep recording its version.
+    '''
+    current = _lexicons.get(lexicon.id)
+    if current is not None and not replace:
+        if current.key != lexicon.key:
+            raise ValueError(f"Lexicon '{lexicon.id}' is already registered "
+                             f"as {current.key}, not {lexicon.key}")
+        return current
+    _lexicons[lexicon.id] = lexicon
+    return lexicon
+
+
+def load(path):
+    '''
+    Reads a lexicon file and registers it. Each file is only read once.
+    '''
+    real_path = os.path.realpath(path)
+    lexicon = _files.get(real_path)
+    if lexicon is None:
+        lexicon = _files[real_path] = register(Lexicon.from_file(path))
+    return lexicon
+
+
+def _data_files():
+    return sorted(glob.glob(os.path.join(DATA_DIR, "*.json")))
+
+
+def get(lexicon=None):
+    '''
+    Returns a registered Lexicon by id (default: DEFAULT). A Lexicon passed in
+    is returned as is, and a path to a lexicon file is loaded and registered
+    the first time it's asked for.
+    '''
+    if isinstance(lexicon, Lexicon):
+        return lexicon
+    if lexicon is None:
+        lexicon = DEFAULT
+    found = _lexicons.get(lexicon)
+    if found is not None:
+        return found
+
+    if lexicon.endswith(".json") and os.path.exists(lexicon):
+        return load(lexicon)
+    for path in _data_files():
+        if os.path.splitext(os.path.basename(path))[0] == lexicon:
+            return load(path)
+    raise UnknownLexiconError(f"Unknown lexicon '{lexicon}'. Available: "
+                              f"{', '.join(available())}")
+
+
+_combined_matchers = {}
+
+
+def combined_matcher(ids):
+    '''
+    Returns one CategoryMatcher covering every coding of several lexicons,
+    with categories named "<lexicon id>:<coding>", e.g. "gaucher:masculine".
+    Built once per combination of lexicon versions.
+    '''
+    selected = [get(lexicon) for lexicon in ids]
+    key = tuple(lexicon.key for lexicon in selected)
+    matcher = _combined_matchers.get(key)
+    if matcher is None:
+        matcher = _combined_matchers[key] = CategoryMatcher({
+            f"{lexicon.id}:{coding}": stems
+            for lexicon in selected
+            for coding, stems in lexicon.codings.items()})
+    return matcher
+
+
+def available():
+    '''
+    Returns the ids of the registered and shipped lexicons.
+    '''
+    shipped = [os.path.splitext(os.path.basename(path))[0]
+               for path in _data_files()]
+    return sorted(set(_lexicons) | set(shipped))
+
+
+register(Lexicon(DEFAULT, {"masculine": wordlists.masculine_coded_words,
+                           "feminine": wordlists.feminine_coded_words},
+                 "Gaucher, Friesen and Kay (2011), as used by the original "
+                 "Gender Decoder."))
@@ -0,0 +1,123 @@
+class PrefixMatcher:
+    '''
+    Finds the coded stems a token starts with.
+
+    Stems are indexed by their text and grouped by length, so matching a
+    token costs one dict lookup per distinct stem length instead of one
+    startswith() call per stem.
+
+    stems - An iterable of stems, e.g. wordlists.masculine_coded_words.
+    '''
+
+    def __init__(self, stems):
+        self.stems = tuple(stems)
+        index = {}
+        for stem in self.stems:
+            # Keep repeated stems so they count once per listing, like the
+            # old nested loop did.
+            index[stem] = index.get(stem, ()) + (stem,)
+        self._index = index
+        self._lengths = tuple(sorted({len(stem) for stem in index}))
+
+    def match(self, token):
+        '''
+        Returns a tuple with every stem the token starts with (empty if none).
+        '''
+        hits = ()
+        size = len(token)
+        index = self._index
+        for length in self._lengths:
+            if length > size:
+                break
+            found = index.get(token[:length])
+            if found:
+                hits += found
+        return hits
+
+    def stems_of(self, found):
+        '''
+        Returns the stem each entry of a list of coded words (e.g. an ad's
+        masculine_coded_words) was counted for. A word starting with k stems
+        is listed k times in a row, once per stem, so the entries of each run
+        of a word take its stems in turn. Words matching no stem give None.
+        '''
+        matched = {}
+        stems = []
+        previous = None
+        repeat = 0
+        for word in found:
+            repeat = repeat + 1 if word == previous else 0
+            previous = word
+            hits = matched.get(word)
+            if hits is None:
+                hits = matched[word] = self.match(word)
+            stems.append(hits[repeat % len(hits)] if hits else None)
+        return stems
+
+
+class CategoryMatcher:
+    '''
+    Finds the stems of several categories a token starts with, in one pass.
+
+    All categories' stems share one index, so scoring a token stream against
+    N categories costs about the same as against one, instead of one pass
+    per category.
+
+    categories - Dict of category name -> iterable of stems, e.g.
+                 {"masculine": [...], "feminine": [...]}.
+    '''
+
+    def __init__(self, categories):
+        self.categories = tuple(categories)
+        index = {}
+        for category, stems in categories.items():
+            for stem in stems:
+                index[stem] = index.get(stem, ()) + ((category, stem),)
+        self._index = index
+        self._lengths = tuple(sorted({len(stem) for stem in index}))
+
+    def match(self, token):
+        '''
+        Returns a tuple of (category, stem) pairs, one for every stem the
+        token starts with (empty if none).
+        '''
+        hits = ()
+        size = len(token)
+        index = self._index
+        for length in self._lengths:
+            if length > size:
+                break
+            found = index.get(token[:length])
+            if found:
+                hits += found
+        return hits
+
+    def find(self, tokens):
+        '''
+        Returns a dict of category -> list of the tokens that start with one
+        of its stems, once per matching stem and in token order, i.e. for
+        each category the same list as
+
+            [t for t in tokens for stem in stems if t.startswith(stem)]
+        '''
+        found = {category: [] for category in self.categories}
+        match = self.match
+        for token in tokens:
+            hits = match(token)
+            if hits:
+                for category, _ in hits:
+                    found[category].append(token)
+        return found
+
+    def count(self, tokens):
+        '''
+        Returns a dict of category -> len(self.find(tokens)[category]).
+        '''
+        counts = dict.fromkeys(self.categories, 0)
+        match = self.match
+        for token in tokens:
+            hits = match(token)
+            if hits:
+                for category, _ in hits:
+                    counts[category] += 1
+        return counts
@@ -0,0 +1,76 @@
+import codecs
+import re
+
+# Characters dropped from ads before splitting them into words.
+PUNCTUATION = ".,:;()"
+
+_ERRORS = "genderdecoder.space"
+_DELETE_STR = str.maketrans("", "", PUNCTUATION)
+_DELETE_BYTES = PUNCTUATION.encode("ascii")
+# Runs of characters that are neither whitespace nor non-ASCII, i.e. the
+# stretches of text tokenize() turns into words.
+_WORD_RUN = re.compile("[^\\s\x80-\U0010ffff]+")
+
+
+def _non_ascii_to_space(error):
+    # Each non-ASCII character becomes a word break.
+    return " " * (error.end - error.start), error.end
+
+
+codecs.register_error(_ERRORS, _non_ascii_to_space)
+
+
+def normalize(ad_text):
+    '''
+    Returns the ad as ASCII text with non-ASCII characters replaced by spaces
+    and PUNCTUATION removed. Whitespace is left as is; tokenize() splits on it.
+    '''
+    return (ad_text.encode("ascii", _ERRORS)
+            .translate(None, _DELETE_BYTES)
+            .decode("ascii"))
+
+
+def tokenize(ad_text):
+    '''
+    Returns the list of words assess() matches coded stems against.
+    '''
+    return normalize(ad_text).split()
+
+
+def tokenize_spans(ad_text):
+    '''
+    Returns the same words as tokenize(), as (word, start, end) tuples where
+    ad_text[start:end] is the text the word came from.
+    '''
+    spans = []
+    for run in _WORD_RUN.finditer(ad_text):
+        word = run.group().translate(_DELETE_STR)
+        if word:
+            spans.append((word, run.start(), run.end()))
+    return spans
+
+
+def trim_span(ad_text, start, end):
+    '''
+    Returns (start, end) without the PUNCTUATION at either end of the span,
+    e.g. the span of "leader" rather than "(leader).".
+    '''
+    while start < end and ad_text[start] in PUNCTUATION:
+        start += 1
+    while end > start and ad_text[end - 1] in PUNCTUATION:
+        end -= 1
+    return start, end
+
+
+def tokenize_many(texts):
+    '''
+    Tokenizes a batch of ads. A pandas Series is tokenized with its .str
+    methods and returned as a Series of lists (missing values stay missing);
+    any other iterable gives a list of token lists.
+    '''
+    if hasattr(texts, "str"):
+        return (texts.str.encode("ascii", _ERRORS)
+                .str.decode("ascii")
+                .str.translate(_DELETE_STR)
+                .str.split())
+    return [tokenize(ad_text) for ad_text in texts]
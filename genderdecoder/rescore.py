@@ -0,0 +1,148 @@
+import json
+from collections import Counter
+
+from . import lexicons
+from .assess import assess_many
+from .lexicons import CODINGS, Lexicon
+from .matcher import PrefixMatcher
+from .results import (concat_tables, metadata, read_results, to_table,
+                      write_results)
+
+
+def stem_diff(old, new):
+    '''
+    Returns the stems whose listing differs between two lexicons, as a dict
+    of coding -> (added stems, removed stems). A stem listed a different
+    number of times counts as added or removed, since every listing counts.
+    '''
+    diff = {}
+    for coding in CODINGS:
+        old_stems = Counter(old.codings[coding])
+        new_stems = Counter(new.codings[coding])
+        diff[coding] = (sorted((new_stems - old_stems).elements()),
+                        sorted((old_stems - new_stems).elements()))
+    return diff
+
+
+def changed_stems(diff):
+    '''
+    Returns the set of stems added or removed in any coding of a stem_diff().
+    Only tokens starting with one of them can score differently.
+    '''
+    return {stem for added, removed in diff.values()
+            for stem in added + removed}
+
+
+def scored_lexicon(table):
+    '''
+    Returns the Lexicon a results table was scored with, rebuilt from the
+    stems in its metadata, so it can be diffed against the current one.
+    '''
+    meta = table.schema.metadata or {}
+    if b"codings" not in meta:
+        raise ValueError("Results have no stems recorded; score them again "
+                         "to be able to rescore them")
+    key = meta[b"lexicon"].decode("utf-8")
+    lexicon = Lexicon(key.split("@")[0],
+                      json.loads(meta[b"codings"].decode("utf-8")))
+    if lexicon.key != key:
+        raise ValueError(f"Results recorded as {key} have the stems of "
+                         f"{lexicon.key}")
+    return lexicon
+
+
+def affected_ads(table, stems):
+    '''
+    Returns a NumPy bool array of the ads in a results table with a token
+    starting with any of stems. Each distinct token is matched once, then
+    looked up for every ad by its dictionary id.
+    '''
+    import numpy as np
+    import pyarrow.compute as pc
+
+    if "tokens" not in table.column_names:
+        raise ValueError("Results have no tokens; write them with texts to "
+                         "be able to rescore them")
+    tokens = table["tokens"].combine_chunks()
+    affected = np.zeros(len(tokens), dtype=bool)
+    if not stems or not len(tokens):
+        return affected
+    words = tokens.flatten()
+    matcher = PrefixMatcher(stems)
+    hits = np.array([bool(matcher.match(word))
+                     for word in words.dictionary.to_pylist()], dtype=bool)
+    if not hits.any():
+        return affected
+    lengths = pc.fill_null(pc.list_value_length(tokens), 0).to_numpy()
+    ads = np.repeat(np.arange(len(tokens)), lengths)
+    affected[ads[hits[words.indices.to_numpy()]]] = True
+    return affected
+
+
+def rescore(table, lexicon=None):
+    '''
+    Brings a results table up to date with a lexicon that has changed since
+    it was scored, e.g. after editing wordlists.py.
+
+    The stems of the two versions are diffed, and only the ads with a token
+    starting with an added or removed stem are scored again, from their
+    stored tokens. Every other ad scores the same under both versions and is
+    kept as is. The table must have been written with texts (see to_table()).
+
+    Returns (table, rescored): the updated table, recording the new lexicon
+    and the one it was "rescored_from" in its metadata, and the positions of
+    the ads that were scored again.
+
+    lexicon - Id of (or path to) the lexicon to rescore with (default: the
+              current version of the one the table was scored with).
+    '''
+    import numpy as np
+
+    old = scored_lexicon(table)
+    new = lexicons.get(old.id if lexicon is None else lexicon)
+    if new.key == old.key:
+        return table, np.array([], dtype=np.int64)
+
+    affected = affected_ads(table, changed_stems(stem_diff(old, new)))
+    rescored = np.flatnonzero(affected)
+    kept = np.flatnonzero(~affected)
+    meta = metadata(new, rescored_from=old.key)
+    if not len(rescored):
+        return table.replace_schema_metadata(meta), rescored
+
+    subset = table.take(rescored)
+    # Tokens have no spaces, punctuation or non-ASCII characters, so joined
+    # back up they tokenize to themselves, and assess_many() can match each
+    # distinct token once.
+    tokens = subset["tokens"].combine_chunks()
+    words = tokens.flatten()
+    words = np.array(words.dictionary.to_pylist(),
+                     dtype=object)[words.indices.to_numpy()].tolist()
+    offsets = tokens.offsets.to_numpy()
+    offsets = offsets - offsets[0]
+    texts = [" ".join(words[offsets[i]:offsets[i + 1]])
+             for i in range(len(tokens))]
+    updated = to_table(assess_many(texts, lexicon=new), new)
+    for name in table.column_names:
+        if name not in updated.column_names:
+            updated = updated.append_column(name, subset[name])
+    updated = updated.select(table.column_names)
+
+    # Put the ads back in their original order
+    merged = concat_tables([table.take(kept).replace_schema_metadata(meta),
+                            updated.cast(table.schema)
+                            .replace_schema_metadata(meta)])
+    order = np.empty(len(table), dtype=np.int64)
+    order[np.concatenate([kept, rescored])] = np.arange(len(table))
+    return merged.take(order), rescored
+
+
+def rescore_results(path, lexicon=None, output=None):
+    '''
+    Runs rescore() on a file written by write_results() and writes the
+    updated results to output (default: back to path). Returns the positions
+    of the ads that were scored again.
+    '''
+    table, rescored = rescore(read_results(path), lexicon)
+    write_results(output or path, table)
+    return rescored
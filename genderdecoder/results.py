@@ -0,0 +1,234 @@
+import json
+import os
+
+from . import lexicons
+from .assess import RESULTS
+from .lexicons import CODINGS
+from .normalize import tokenize_many
+
+# Written to the schema metadata, so readers can tell what they're reading.
+FORMAT = "genderdecoder-results/1"
+# The columns assess() results are stored in, besides any kept from the input
+RESULT_COLUMNS = ["result", "num_masculine_words", "num_feminine_words",
+                  "masculine_coded_words", "feminine_coded_words",
+                  "masculine_stems", "feminine_stems", "tokens"]
+# Columns of assess() results that are not stored: the explanation follows
+# from the result and counts, and the lexicon is kept in the metadata
+UNSTORED_COLUMNS = ["explanation", "lexicon"]
+
+
+def is_parquet(path):
+    return str(path).endswith((".parquet", ".pq"))
+
+
+def _lexicon_of(key):
+    # The Lexicon that produced results recorded as "<id>@<version>"
+    lexicon = lexicons.get(key.split("@")[0])
+    if lexicon.key != key:
+        raise ValueError(f"Results were scored with {key}, but lexicon "
+                         f"'{lexicon.id}' is now {lexicon.key}")
+    return lexicon
+
+
+def _flatten(df, column):
+    # A column of word lists as (flat words, offsets), like assess_many()
+    words = []
+    offsets = [0]
+    for ad_words in df[column]:
+        if isinstance(ad_words, (list, tuple)) or hasattr(ad_words, "__array__"):
+            words.extend(ad_words)
+        offsets.append(len(words))
+    return words, offsets
+
+
+def _stem_ids(words, stems, matcher):
+    # The index into stems of the stem each coded word was counted for. A
+    # word matching k stems is listed k times in a row, once per stem.
+    ids = {stem: i for i, stem in enumerate(stems)}
+    return [None if stem is None else ids[stem]
+            for stem in matcher.stems_of(words)]
+
+
+def _tokens_array(texts):
+    # The tokens of each ad as a list of dictionary-encoded words, null for
+    # ads that are not strings
+    import pyarrow as pa
+
+    tokens = [ad_tokens if isinstance(ad_tokens, list) else None
+              for ad_tokens in tokenize_many(texts)]
+    return pa.array(tokens, type=pa.list_(pa.string())).cast(
+        pa.list_(pa.dictionary(pa.int32(), pa.string())))
+
+
+def to_table(data, lexicon=None, columns=(), texts=None):
+    '''
+    Converts scored ads to a compact Arrow table:
+
+        result - dictionary-encoded label
+        num_masculine_words, num_feminine_words - int32 counts
+        masculine_coded_words, feminine_coded_words - lists of
+            dictionary-encoded words
+        masculine_stems, feminine_stems - lists of the stem each word was
+            counted for, as int16 ids into the lexicon's stems
+        tokens - with texts, the ads' tokenize() words, as lists of
+            dictionary-encoded words, so rescore() can score them again
+
+    Each list column is a flat array of values plus one offset per ad, so
+    nothing is parsed back from strings. The lexicon's key and stems are kept
+    in the schema metadata.
+
+    data - A batch from assess_many(), or a DataFrame with assess() result
+           columns, e.g. from batch_to_frame() or score_frame().
+    lexicon - The lexicon the ads were scored with (default: the one the
+              batch or DataFrame records, else lexicons.DEFAULT).
+    columns - Other columns of a DataFrame to keep, e.g. ["title", "query"].
+    texts - Optional descriptions of the ads, to store the tokens of.
+    '''
+    import pyarrow as pa
+
+    if isinstance(data, dict):
+        results = data["result"]
+        key = data["lexicon"]
+        flat = {coding: (data[f"{coding}_coded_words"],
+                         data[f"{coding}_offsets"]) for coding in CODINGS}
+        counts = {coding: data[f"num_{coding}_words"] for coding in CODINGS}
+    else:
+        results = data["result"]
+        key = None
+        if "lexicon" in data and len(data):
+            key = data["lexicon"].iloc[0]
+        flat = {coding: _flatten(data, f"{coding}_coded_words")
+                for coding in CODINGS}
+        counts = {coding: [offsets[i + 1] - offsets[i]
+                           for i in range(len(offsets) - 1)]
+                  for coding, (_, offsets) in flat.items()}
+    if lexicon is not None or key is None:
+        lexicon = lexicons.get(lexicon)
+    else:
+        lexicon = _lexicon_of(key)
+
+    codes = [None if result is None or result != result
+             else RESULTS.index(result) for result in results]
+    arrays = {"result": pa.DictionaryArray.from_arrays(
+        pa.array(codes, type=pa.int8()), RESULTS)}
+    for coding in CODINGS:
+        arrays[f"num_{coding}_words"] = pa.array(counts[coding],
+                                                 type=pa.int32())
+    for coding in CODINGS:
+        words, offsets = flat[coding]
+        offsets = pa.array(offsets, type=pa.int32())
+        stems = list(lexicon.codings[coding])
+        stem_ids = pa.array(_stem_ids(words, stems, lexicon.matcher(coding)),
+                            type=pa.int16())
+        arrays[f"{coding}_coded_words"] = pa.ListArray.from_arrays(
+            offsets, pa.array(words, type=pa.string()).dictionary_encode())
+        arrays[f"{coding}_stems"] = pa.ListArray.from_arrays(
+            offsets, pa.DictionaryArray.from_arrays(stem_ids, stems))
+
+    if texts is not None:
+        arrays["tokens"] = _tokens_array(texts)
+
+    table = pa.table(arrays)
+    for column in columns:
+        table = table.append_column(column,
+                                    pa.array(data[column], from_pandas=True))
+    return table.replace_schema_metadata(metadata(lexicon))
+
+
+def metadata(lexicon, **extra):
+    '''
+    Returns the schema metadata of a results table scored with lexicon: the
+    format, the lexicon's key and its stems (so the stems can be diffed after
+    the lexicon changes), and any extra string values.
+    '''
+    return {"format": FORMAT, "lexicon": lexicon.key,
+            "codings": json.dumps(lexicon.codings), **extra}
+
+
+def concat_tables(tables):
+    '''
+    Concatenates tables from to_table() with the same columns. A kept input
+    column whose type differs between tables (e.g. numbers in one CSV, text
+    in another) is stored as strings.
+    '''
+    import pyarrow as pa
+
+    fields = []
+    for field in tables[0].schema:
+        types = {table.schema.field(field.name).type
+                 for table in tables} - {pa.null()}
+        if len(types) > 1:
+            field = field.with_type(pa.string())
+        elif types:
+            field = field.with_type(types.pop())
+        fields.append(field)
+    schema = pa.schema(fields, metadata=tables[0].schema.metadata)
+    return pa.concat_tables([table.cast(schema) for table in tables])
+
+
+def write_results(path, data, lexicon=None, columns=(), texts=None):
+    '''
+    Writes scored ads in the compact format of to_table(): an uncompressed
+    Arrow IPC file, which read_results() can memory-map without copying, or
+    a Parquet file if path ends in ".parquet" (smaller, but decoded on read).
+
+    data - A batch from assess_many(), a DataFrame of assess() results, or a
+           table from to_table().
+    lexicon, columns, texts - See to_table().
+    '''
+    import pyarrow as pa
+
+    table = data if isinstance(data, pa.Table) else to_table(data, lexicon,
+                                                              columns, texts)
+    # The Arrow file format allows one dictionary per column
+    table = table.unify_dictionaries().combine_chunks()
+    tmp = f"{path}.tmp"
+    if is_parquet(path):
+        import pyarrow.parquet as pq
+
+        pq.write_table(table, tmp)
+    else:
+        with pa.OSFile(tmp, "wb") as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+    os.replace(tmp, path)
+
+
+def read_results(path, columns=None, memory_map=True):
+    '''
+    Reads a file written by write_results() as an Arrow table. Arrow files
+    are memory-mapped, so only the columns and rows used are paged in.
+    Use table.to_pandas() for a DataFrame.
+
+    columns - Names of the columns to read (default: all).
+    '''
+    import pyarrow as pa
+
+    if is_parquet(path):
+        import pyarrow.parquet as pq
+
+        return pq.read_table(path, columns=columns, memory_map=memory_map)
+
+    source = pa.memory_map(path) if memory_map else pa.OSFile(path)
+    table = pa.ipc.open_file(source).read_all()
+    if columns is not None:
+        table = table.select(columns)
+    return table
+
+
+def stem_counts(table, coding):
+    '''
+    Returns how often each stem of a coding was matched across a results
+    table, as a dict of stem -> count, most common first, counted on the
+    stem ids without building any strings.
+    '''
+    import pyarrow.compute as pc
+
+    stems = table[f"{coding}_stems"].combine_chunks().flatten()
+    if not len(stems):
+        return {}
+    counts = pc.value_counts(stems.indices)
+    dictionary = stems.dictionary.to_pylist()
+    pairs = [(dictionary[item["values"]], item["counts"])
+             for item in counts.to_pylist()]
+    return dict(sorted(pairs, key=lambda pair: -pair[1]))
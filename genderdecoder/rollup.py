@@ -0,0 +1,291 @@
+import ast
+import itertools
+import os
+
+from . import lexicons
+from .assess import RESULTS, classify
+from .lexicons import CODINGS
+
+DIMENSIONS = ("company_name", "location", "query")
+TOP_STEMS = 5
+# The columns of summary(), after the dimension's
+SUMMARY_COLUMNS = ["result", "num_ads", *RESULTS,
+                   "mean_masculine_words", "mean_feminine_words",
+                   "top_masculine_stems", "top_feminine_stems"]
+
+
+def _is_list(value):
+    return isinstance(value, (list, tuple)) or hasattr(value, "__array__")
+
+
+class Rollup:
+    '''
+    Coding distributions and stem counts of scored job ads, per company,
+    location, query or any other column, kept as additive totals so they can
+    be refreshed as new ads are scored instead of recomputed.
+
+    The totals are one long table of (dimension, key, field, value) rows,
+    e.g. ("company_name", "Boeing", "result:neutral", 3) or
+    ("query", "engineer", "masculine:compet", 41). Adding ads adds to the
+    values, so rollups of separate batches can be merged.
+
+    dimensions - The columns to roll up by.
+    lexicon - The lexicon the ads were scored with, to map coded words
+              back to stems when the ads don't carry them.
+    '''
+
+    def __init__(self, dimensions=DIMENSIONS, lexicon=None):
+        import pandas as pd
+
+        self.dimensions = list(dimensions)
+        self.lexicon = lexicons.get(lexicon)
+        self.totals = pd.Series(
+            [], dtype="int64",
+            index=pd.MultiIndex.from_tuples(
+                [], names=["dimension", "key", "field"]))
+
+    def add_frame(self, df, weight_column=None):
+        '''
+        Adds scored ads: a DataFrame with a result column and either the
+        coded word lists (as from score_frame() or the dataset) or the stem
+        lists of read_results(). All dimensions are added in one grouped sum.
+        Ads without a result and dimensions missing from df are skipped.
+
+        weight_column - Optional column of the number of ads each row stands
+                        for, e.g. "cluster_size".
+        '''
+        import numpy as np
+        import pandas as pd
+
+        df = df[df["result"].notna()]
+        dimensions = [dim for dim in self.dimensions if dim in df]
+        if not len(df) or not dimensions:
+            return self
+        num_ads = len(df)
+        ads = np.arange(num_ads)
+        weights = (df[weight_column].to_numpy(dtype=np.int64) if weight_column
+                   else np.ones(num_ads, dtype=np.int64))
+
+        # Everything counted about the ads, as parallel arrays of the ad, the
+        # field (an index into names) and the value
+        names = []
+        rows, fields, values = [], [], []
+
+        def count(ad_rows, field_ids, field_values):
+            rows.append(ad_rows)
+            fields.append(field_ids)
+            values.append(field_values)
+
+        def field(name):
+            names.append(name)
+            return np.full(num_ads, len(names) - 1)
+
+        count(ads, field("num_ads"), weights)
+        codes, uniques = pd.factorize(df["result"].astype(str))
+        count(ads, codes + len(names), weights)
+        names.extend(f"result:{result}" for result in uniques)
+
+        for coding in CODINGS:
+            from_stems = f"{coding}_stems" in df
+            lists = [ad_list if _is_list(ad_list) else ()
+                     for ad_list in df[f"{coding}_stems" if from_stems
+                                       else f"{coding}_coded_words"]]
+            lengths = np.fromiter(map(len, lists), dtype=np.int64,
+                                  count=num_ads)
+            count(ads, field(f"num_{coding}_words"), lengths * weights)
+
+            flat = list(itertools.chain.from_iterable(lists))
+            flat_ads = np.repeat(ads, lengths)
+            codes, uniques = pd.factorize(np.array(flat, dtype=object))
+            if not from_stems:
+                # Each distinct word is matched once. A word matching k stems
+                # is listed k times in a row, and each entry counts for one
+                # of its stems in turn, as in PrefixMatcher.stems_of()
+                matcher = self.lexicon.matcher(coding)
+                word_stems = [matcher.match(word) for word in uniques]
+                per_word = np.fromiter(map(len, word_stems), dtype=np.int64,
+                                       count=len(uniques))
+                starts = np.concatenate([[0], np.cumsum(per_word)[:-1]])
+                entries = np.arange(len(codes))
+                new_run = np.ones(len(codes), dtype=bool)
+                new_run[1:] = codes[1:] != codes[:-1]
+                in_run = entries - np.maximum.accumulate(
+                    np.where(new_run, entries, 0))
+                matches = per_word[codes]
+                stem_codes, uniques = pd.factorize(np.array(
+                    list(itertools.chain.from_iterable(word_stems)),
+                    dtype=object))
+                known = matches > 0
+                codes = stem_codes[starts[codes][known] +
+                                   in_run[known] % matches[known]]
+                flat_ads = flat_ads[known]
+            count(flat_ads, codes + len(names), weights[flat_ads])
+            names.extend(f"{coding}:{stem}" for stem in uniques)
+
+        rows = np.concatenate(rows)
+        fields = np.concatenate(fields)
+        values = np.concatenate(values)
+
+        # Sum the values per (dimension, key, field) as one integer key each
+        added = []
+        for dim in dimensions:
+            keys, key_names = pd.factorize(df[dim])
+            keys = keys[rows]
+            known = keys >= 0
+            groups, inverse = np.unique(
+                keys[known] * len(names) + fields[known], return_inverse=True)
+            sums = np.bincount(inverse, weights=values[known]).astype(np.int64)
+            added.append(pd.Series(sums, index=pd.MultiIndex.from_arrays(
+                [np.full(len(groups), dim, dtype=object),
+                 np.asarray(key_names.astype(str), dtype=object)[
+                     groups // len(names)],
+                 np.asarray(names, dtype=object)[groups % len(names)]],
+                names=["dimension", "key", "field"])))
+        added = pd.concat(added)
+        self.totals = (added.add(self.totals, fill_value=0).astype("int64")
+                       .rename("value"))
+        return self
+
+    def update(self, other):
+        '''
+        Adds the totals of another Rollup to this one. Raises ValueError if
+        they were scored with different lexicons.
+        '''
+        if other.lexicon.key != self.lexicon.key:
+            raise ValueError(f"Can't add totals of ads scored with "
+                             f"{other.lexicon.key} to {self.lexicon.key}")
+        self.totals = (self.totals.add(other.totals, fill_value=0)
+                       .astype("int64").rename("value"))
+        return self
+
+    def keys(self, dimension):
+        '''
+        Returns the values seen for a dimension, e.g. every company.
+        '''
+        if dimension not in self.totals.index.get_level_values("dimension"):
+            return []
+        return list(self.totals.loc[dimension].index
+                    .get_level_values("key").unique())
+
+    def summary(self, dimension, top=TOP_STEMS):
+        '''
+        Returns a DataFrame with one row per value of dimension, most ads
+        first:
+
+            result - classify() of the total coded words of its ads
+            num_ads - number of ads
+            one column per result - number of ads with that result
+            mean_masculine_words, mean_feminine_words - per ad
+            top_masculine_stems, top_feminine_stems - the top most matched
+                stems, most common first, separated by spaces
+        '''
+        import pandas as pd
+
+        columns = [dimension, *SUMMARY_COLUMNS]
+        if dimension not in self.totals.index.get_level_values("dimension"):
+            return pd.DataFrame(columns=columns)
+        totals = self.totals.loc[dimension]
+        fields = totals.index.get_level_values("field")
+        plain = totals[~fields.str.contains(":") |
+                       fields.str.startswith("result:")].unstack(fill_value=0)
+        plain.columns = [column.split(":", 1)[-1] for column in plain.columns]
+        plain = plain.reindex(columns=["num_ads", "num_masculine_words",
+                                       "num_feminine_words", *RESULTS],
+                              fill_value=0)
+
+        summary = pd.DataFrame(index=plain.index)
+        summary["result"] = [classify(m, f) for m, f in
+                             zip(plain["num_masculine_words"],
+                                 plain["num_feminine_words"])]
+        summary["num_ads"] = plain["num_ads"]
+        for result in RESULTS:
+            summary[result] = plain[result]
+        for coding in CODINGS:
+            summary[f"mean_{coding}_words"] = (
+                plain[f"num_{coding}_words"] / plain["num_ads"]).round(2)
+        for coding in CODINGS:
+            stems = totals[fields.str.startswith(f"{coding}:")]
+            stems = stems.rename("value").reset_index()
+            stems["field"] = stems["field"].str.split(":", n=1).str[1]
+            stems = stems.sort_values(["key", "value", "field"],
+                                      ascending=[True, False, True])
+            summary[f"top_{coding}_stems"] = (
+                stems.groupby("key").head(top).groupby("key")["field"]
+                .agg(" ".join).reindex(summary.index, fill_value=""))
+
+        summary = summary.rename_axis(dimension).reset_index()
+        return summary.sort_values(["num_ads", dimension],
+                                   ascending=[False, True],
+                                   ignore_index=True)[columns]
+
+    def save(self, path):
+        '''
+        Writes the totals to a Parquet file, atomically, recording the key of
+        the lexicon in its metadata.
+        '''
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        table = pa.Table.from_pandas(self.totals.rename("value").reset_index(),
+                                     preserve_index=False)
+        table = table.replace_schema_metadata({
+            **(table.schema.metadata or {}), "lexicon": self.lexicon.key})
+        pq.write_table(table, f"{path}.tmp")
+        os.replace(f"{path}.tmp", path)
+
+    @classmethod
+    def load(cls, path, dimensions=DIMENSIONS, lexicon=None,
+             missing_ok=False):
+        '''
+        Reads totals written by save(). With missing_ok, a missing file gives
+        an empty Rollup. Raises ValueError if the totals were scored with a
+        lexicon (or version) other than lexicon, since adding ads scored with
+        another one would mix their stem counts.
+        '''
+        import pyarrow.parquet as pq
+
+        rollup = cls(dimensions, lexicon)
+        try:
+            table = pq.read_table(path)
+        except FileNotFoundError:
+            if missing_ok:
+                return rollup
+            raise
+        meta = table.schema.metadata or {}
+        key = meta.get(b"lexicon", b"").decode("utf-8")
+        if key != rollup.lexicon.key:
+            raise ValueError(f"{path} holds ads scored with "
+                             f"{key or 'an unrecorded lexicon'}, not "
+                             f"{rollup.lexicon.key}")
+        frame = table.to_pandas()
+        rollup.totals = frame.set_index(["dimension", "key",
+                                         "field"])["value"].astype("int64")
+        return rollup
+
+
+def read_scored(path):
+    '''
+    Reads a file of scored ads for Rollup.add_frame(): results from
+    write_results() (.arrow), a Parquet dataset, or a CSV written by the
+    score command, whose word lists are parsed from their Python reprs.
+    '''
+    import pandas as pd
+
+    if str(path).endswith(".arrow"):
+        from .results import read_results
+
+        table = read_results(path)
+        if "tokens" in table.column_names:
+            table = table.drop(["tokens"])
+        return table.to_pandas()
+    if str(path).endswith(".parquet"):
+        return pd.read_parquet(path)
+
+    df = pd.read_csv(path)
+    for coding in CODINGS:
+        column = f"{coding}_coded_words"
+        if column in df:
+            df[column] = df[column].map(
+                lambda s: ast.literal_eval(s) if isinstance(s, str)
+                and s.startswith("[") else None)
+    return df
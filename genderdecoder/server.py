@@ -0,0 +1,365 @@
+import json
+import queue
+import socket
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from . import instrument
+from . import lexicons
+from .assess import assess_many, explain
+
+HOST = "127.0.0.1"
+PORT = 8765
+MAX_BATCH = 256
+MAX_WAIT = 0.002
+# Largest request body accepted, in bytes.
+MAX_BODY = 16 * 1024 * 1024
+
+
+def batch_results(batch):
+    '''
+    Turns the columns returned by assess_many() into one assess()-style dict
+    per ad (None for ads that were not strings).
+    '''
+    results = []
+    masc_offsets = batch["masculine_offsets"]
+    fem_offsets = batch["feminine_offsets"]
+    for i, result in enumerate(batch["result"]):
+        if result is None:
+            results.append(None)
+            continue
+        num_masc = batch["num_masculine_words"][i]
+        num_fem = batch["num_feminine_words"][i]
+        results.append({
+            "result": result,
+            "explanation": explain(result, num_masc, num_fem),
+            "masculine_coded_words": batch["masculine_coded_words"][
+                masc_offsets[i]:masc_offsets[i + 1]],
+            "feminine_coded_words": batch["feminine_coded_words"][
+                fem_offsets[i]:fem_offsets[i + 1]],
+            "lexicon": batch["lexicon"],
+        })
+    return results
+
+
+class Metrics:
+    '''
+    Thread-safe request, ad and batch counters, and a window of the most
+    recent request latencies.
+
+    window - Number of recent latencies percentiles are computed over.
+    '''
+
+    def __init__(self, window=10000):
+        self.started = time.monotonic()
+        self.requests = 0
+        self.errors = 0
+        self.ads = 0
+        self.batches = 0
+        self.batched_ads = 0
+        self._latencies = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def request(self, seconds, ads=0, error=False):
+        with self._lock:
+            self.requests += 1
+            self.ads += ads
+            self.errors += error
+            self._latencies.append(seconds)
+
+    def batch(self, size):
+        with self._lock:
+            self.batches += 1
+            self.batched_ads += size
+
+    def snapshot(self):
+        '''
+        Returns the counters, throughput since start and latency percentiles
+        (in milliseconds) as a dict.
+        '''
+        with self._lock:
+            latencies = sorted(self._latencies)
+            uptime = time.monotonic() - self.started
+            stats = {"uptime_s": uptime,
+                     "requests": self.requests,
+                     "errors": self.errors,
+                     "ads": self.ads,
+                     "requests_per_s": self.requests / uptime,
+                     "ads_per_s": self.ads / uptime,
+                     "batches": self.batches,
+                     "mean_batch_size": (self.batched_ads / self.batches
+                                         if self.batches else 0.0)}
+        for name, q in (("p50", 0.5), ("p90", 0.9), ("p99", 0.99)):
+            stats[f"latency_{name}_ms"] = (
+                latencies[min(int(q * len(latencies)), len(latencies) - 1)]
+                * 1000 if latencies else 0.0)
+        return stats
+
+
+class Batcher:
+    '''
+    Collects single ads submitted from many threads and scores them together
+    with assess_many(), on one background thread.
+
+    A batch is scored once max_batch ads are waiting or max_wait seconds have
+    passed since its first ad arrived, whichever is first, so concurrent
+    requests share one pass over their vocabulary.
+    '''
+
+    def __init__(self, max_batch=MAX_BATCH, max_wait=MAX_WAIT, metrics=None):
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.metrics = metrics
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, daemon=True,
+                                        name="genderdecoder-batcher")
+        self._thread.start()
+
+    def submit(self, ad_text, lexicon=None):
+        '''
+        Queues an ad and returns a Future for its assess()-style result.
+        '''
+        future = Future()
+        self._queue.put((ad_text, lexicons.get(lexicon), future))
+        return future
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            pending = [item]
+            deadline = time.monotonic() + self.max_wait
+            while len(pending) < self.max_batch:
+                timeout = deadline - time.monotonic()
+                try:
+                    item = (self._queue.get(timeout=timeout) if timeout > 0
+                            else self._queue.get_nowait())
+                except queue.Empty:
+                    break
+                if item is None:
+                    self._score(pending)
+                    return
+                pending.append(item)
+            self._score(pending)
+
+    def _score(self, pending):
+        by_lexicon = {}
+        for ad_text, lexicon, future in pending:
+            by_lexicon.setdefault(lexicon, []).append((ad_text, future))
+        for lexicon, items in by_lexicon.items():
+            try:
+                batch = assess_many([ad_text for ad_text, _ in items],
+                                    lexicon=lexicon)
+            except Exception as e:
+                for _, future in items:
+                    future.set_exception(e)
+                continue
+            if self.metrics is not None:
+                self.metrics.batch(len(items))
+            for (_, future), result in zip(items, batch_results(batch)):
+                future.set_result(result)
+
+
+class RequestError(Exception):
+    '''
+    A client error, answered with HTTP status 400.
+    '''
+
+
+class ScoringHandler(BaseHTTPRequestHandler):
+    '''
+    Answers the scoring API:
+
+        POST /assess        {"text": "...", "lexicon": "gaucher"}
+        POST /assess_many   {"texts": ["...", ...], "lexicon": "gaucher"}
+        GET  /metrics       counters, throughput and latency percentiles
+        GET  /stats         instrument.stats(), or instrument.prometheus()
+                            with Accept: text/plain
+        GET  /health        {"status": "ok"}
+
+    "lexicon" is optional and defaults to the server's lexicon. It must be
+    the id of a lexicon the server resolved when it started; paths to
+    lexicon files are rejected.
+    '''
+
+    protocol_version = "HTTP/1.1"
+    server_version = "genderdecoder"
+
+    def setup(self):
+        super().setup()
+        # Headers and body are written separately; don't let Nagle's
+        # algorithm hold the body back on keep-alive connections.
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def do_GET(self):
+        if self.path == "/health":
+            self._send(200, {"status": "ok"})
+        elif self.path == "/metrics":
+            self._send(200, self.server.metrics.snapshot())
+        elif self.path == "/stats":
+            if "text/plain" in self.headers.get("Accept", ""):
+                self._send_bytes(200, instrument.prometheus().encode("utf-8"),
+                                 "text/plain; version=0.0.4")
+            else:
+                self._send(200, instrument.stats())
+        else:
+            self._send(404, {"error": f"No such endpoint: {self.path}"})
+
+    def do_POST(self):
+        start = time.perf_counter()
+        ads = 0
+        try:
+            if self.path == "/assess":
+                body = self._read_json()
+                text = body.get("text")
+                if not isinstance(text, str):
+                    raise RequestError('"text" must be a string')
+                future = self.server.batcher.submit(text, self._lexicon(body))
+                response = future.result()
+                ads = 1
+            elif self.path == "/assess_many":
+                body = self._read_json()
+                texts = body.get("texts")
+                if not isinstance(texts, list):
+                    raise RequestError('"texts" must be a list of strings')
+                # Already a batch, so it's scored on this thread.
+                batch = assess_many(texts, lexicon=self._lexicon(body))
+                response = {"results": batch_results(batch)}
+                ads = len(texts)
+            else:
+                # The body would otherwise be read as the next request on
+                # this keep-alive connection
+                self._discard_body()
+                self._send(404, {"error": f"No such endpoint: {self.path}"})
+                return
+        except RequestError as e:
+            self.server.metrics.request(time.perf_counter() - start,
+                                        error=True)
+            self._send(400, {"error": str(e)})
+            return
+        except Exception as e:
+            self.server.metrics.request(time.perf_counter() - start,
+                                        error=True)
+            self._send(500, {"error": f"{type(e).__name__}: {e}"})
+            return
+        self._send(200, response)
+        self.server.metrics.request(time.perf_counter() - start, ads)
+
+    def _content_length(self):
+        # Without a valid length the body can't be told apart from the next
+        # request, so the connection is closed after the error
+        value = self.headers.get("Content-Length")
+        try:
+            length = int(value)
+        except (TypeError, ValueError):
+            length = -1
+        if length < 0:
+            self.close_connection = True
+            raise RequestError(f"Invalid Content-Length: {value!r}")
+        return length
+
+    def _discard_body(self):
+        length = self._content_length()
+        if length > MAX_BODY:
+            self.close_connection = True
+            return
+        self.rfile.read(length)
+
+    def _read_json(self):
+        length = self._content_length()
+        if length > MAX_BODY:
+            self.close_connection = True
+            raise RequestError(f"Request body over {MAX_BODY} bytes")
+        try:
+            body = json.loads(self.rfile.read(length))
+        except ValueError as e:
+            raise RequestError(f"Invalid JSON: {e}")
+        if not isinstance(body, dict):
+            raise RequestError("Request body must be a JSON object")
+        return body
+
+    def _lexicon(self, body):
+        lexicon_id = body.get("lexicon")
+        if lexicon_id is None:
+            return self.server.lexicon
+        # Only looked up among the lexicons resolved at startup, so a client
+        # can never load (and register) a lexicon file on the server
+        lexicon = (self.server.lexicons.get(lexicon_id)
+                   if isinstance(lexicon_id, str) else None)
+        if lexicon is None:
+            raise RequestError(f"Unknown lexicon {lexicon_id!r}. Available: "
+                               f"{', '.join(sorted(self.server.lexicons))}")
+        return lexicon
+
+    def _send(self, status, payload):
+        self._send_bytes(status, json.dumps(payload).encode("utf-8"),
+                         "application/json")
+
+    def _send_bytes(self, status, data, content_type):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        # Per-request logging would dominate the cost of scoring; see /metrics.
+        pass
+
+
+class ScoringServer(ThreadingHTTPServer):
+    '''
+    A local HTTP/JSON server for genderdecoder.assess(), handling each
+    connection on its own thread and micro-batching single-ad requests.
+
+    The lexicons requests may use are resolved once, when the server starts,
+    and their matchers are built before the first request and stay warm for
+    the life of the server.
+
+    lexicon - Id of (or path to) the default lexicon.
+    allowed - Ids of the other lexicons requests may name (default: every
+              lexicon available at startup).
+    max_batch, max_wait - See Batcher.
+    '''
+
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def __init__(self, host=HOST, port=PORT, lexicon=None,
+                 max_batch=MAX_BATCH, max_wait=MAX_WAIT, allowed=None):
+        self.lexicon = lexicons.get(lexicon)
+        if allowed is None:
+            allowed = lexicons.available()
+        self.lexicons = {lexicon_id: lexicons.get(lexicon_id)
+                         for lexicon_id in allowed}
+        self.lexicons[self.lexicon.id] = self.lexicon
+        for allowed_lexicon in self.lexicons.values():
+            allowed_lexicon.combined_matcher()
+        self.metrics = Metrics()
+        self.batcher = Batcher(max_batch, max_wait, self.metrics)
+        super().__init__((host, port), ScoringHandler)
+
+    def server_close(self):
+        super().server_close()
+        self.batcher.close()
+
+
+def serve(host=HOST, port=PORT, lexicon=None, max_batch=MAX_BATCH,
+          max_wait=MAX_WAIT, allowed=None):
+    '''
+    Runs a ScoringServer until interrupted.
+    '''
+    with ScoringServer(host, port, lexicon, max_batch, max_wait,
+                       allowed) as server:
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
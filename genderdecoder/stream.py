@@ -0,0 +1,221 @@
+import json
+import os
+from collections import deque
+
+from .aggregate import Aggregates
+from .assess import batch_to_frame
+from .corpus import (CHUNKSIZE, TEXT_COLUMN, add_cache_stats, default_workers,
+                     make_executor, score_chunk)
+from .errors import check_on_error, raise_first
+
+
+def is_jsonl(path):
+    return str(path).endswith((".jsonl", ".ndjson"))
+
+
+def read_csv_chunks(path, chunksize=CHUNKSIZE, start=0):
+    '''
+    Yields (chunk, position) pairs for a CSV, where chunk is a DataFrame of at
+    most chunksize rows and position is the number of rows read so far.
+
+    start - Number of data rows to skip, e.g. a position from an earlier run.
+    '''
+    import pandas as pd
+
+    skiprows = (lambda i: 0 < i <= start) if start else None
+    position = start
+    for chunk in pd.read_csv(path, chunksize=chunksize, skiprows=skiprows):
+        position += len(chunk)
+        yield chunk, position
+
+
+def read_jsonl_chunks(path, chunksize=CHUNKSIZE, start=0):
+    '''
+    Yields (chunk, position) pairs for a JSON Lines file, where chunk is a
+    DataFrame of at most chunksize records and position is the byte offset
+    just after the chunk's last line.
+
+    start - Byte offset to start reading at, e.g. a position from an earlier
+            run. It must be at the start of a line.
+    '''
+    import pandas as pd
+
+    with open(path, "rb") as f:
+        f.seek(start)
+        records = []
+        while True:
+            line = f.readline()
+            if line.strip():
+                records.append(json.loads(line))
+            if records and (len(records) == chunksize or not line):
+                yield pd.DataFrame.from_records(records), f.tell()
+                records = []
+            if not line:
+                break
+
+
+def read_chunks(path, chunksize=CHUNKSIZE, start=0):
+    '''
+    Yields (chunk, position) pairs for a CSV or JSON Lines file. Positions are
+    row counts for CSVs and byte offsets for JSON Lines.
+    '''
+    if is_jsonl(path):
+        return read_jsonl_chunks(path, chunksize, start)
+    return read_csv_chunks(path, chunksize, start)
+
+
+def _write_chunk(df, f, jsonl, header):
+    if jsonl:
+        text = df.to_json(orient="records", lines=True)
+        # Older pandas versions don't end the last record with a newline.
+        if not text.endswith("\n"):
+            text += "\n"
+    else:
+        text = df.to_csv(index=False, header=header)
+    f.write(text.encode("utf-8"))
+
+
+def checkpoint_path(output):
+    return f"{output}.checkpoint"
+
+
+def load_checkpoint(output):
+    '''
+    Returns the checkpoint left by score_stream() for output, or None.
+    '''
+    try:
+        with open(checkpoint_path(output)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def _save_checkpoint(output, checkpoint):
+    path = checkpoint_path(output)
+    with open(f"{path}.tmp", "w") as f:
+        json.dump(checkpoint, f)
+    os.replace(f"{path}.tmp", path)
+
+
+def score_stream(path, output, text_column=TEXT_COLUMN, chunksize=CHUNKSIZE,
+                 workers=None, start=0, resume=False, cache_path=None,
+                 aggregates_path=None, group_column=None, lexicon=None,
+                 on_error="mark", errors=None, cache_stats=None):
+    '''
+    Scores a CSV or JSON Lines file of job ads chunk by chunk and appends each
+    scored chunk to output (CSV or JSON Lines, by extension) as soon as it is
+    done. Peak memory depends on chunksize and workers, not on the file size.
+
+    After every chunk, the input position and output size are saved to
+    "<output>.checkpoint", so a crashed run can continue with resume=True.
+    The checkpoint is removed once the whole file has been scored.
+
+    start - Row (CSV) or byte (JSON Lines) offset to start reading at.
+    resume - Continue from the checkpoint of an earlier run, if there is one.
+    cache_path - Optional SQLite file to cache results in (see ResultCache).
+    aggregates_path - Optional JSON file of Aggregates to add the scored ads
+                      to (created if missing). Until the run finishes, the
+                      running totals are kept in the checkpoint.
+    group_column - The column to group the aggregates by.
+    lexicon - Id of (or path to) the lexicon to score with.
+    on_error - What to do with rows whose text is not a string: "mark" them
+               with a result of None, "skip" (drop) them, or "raise"
+               InvalidAdError. See assess_many().
+    errors - Optional list to append an ErrorRecord to for each row marked or
+             skipped, indexed by its row number in the input (for JSON Lines
+             started at a byte offset, counted from that offset).
+    cache_stats - Optional dict to add the cache's "hits" and "misses" in
+                  this call to.
+
+    Returns the number of rows written by this call.
+    '''
+    check_on_error(on_error)
+    checkpoint = load_checkpoint(output) if resume else None
+    if checkpoint:
+        if checkpoint["input"] != os.path.abspath(path):
+            raise ValueError(f"{checkpoint_path(output)} is for "
+                             f"{checkpoint['input']}, not {path}")
+        start = checkpoint["position"]
+        columns = checkpoint["columns"]
+    else:
+        checkpoint = {"input": os.path.abspath(path), "rows": 0,
+                      "read": 0 if is_jsonl(path) else start}
+        columns = None
+
+    aggregates = None
+    if aggregates_path is not None:
+        if "aggregates" in checkpoint:
+            aggregates = Aggregates.from_dict(checkpoint["aggregates"])
+        else:
+            aggregates = Aggregates.load(aggregates_path, missing_ok=True,
+                                         lexicon=lexicon)
+
+    jsonl = is_jsonl(output)
+    workers = workers or default_workers()
+    rows = 0
+    # Input rows read by this call, and so the row number of the next chunk
+    read = checkpoint.get("read", 0)
+    with open(output, "r+b" if columns else "wb") as f, \
+            make_executor(workers, cache_path, lexicon) as executor:
+        if columns:
+            # Drop anything written after the last checkpoint.
+            f.truncate(checkpoint["size"])
+            f.seek(checkpoint["size"])
+
+        pending = deque()
+        chunks = read_chunks(path, chunksize, start)
+        while True:
+            for chunk, position in chunks:
+                if text_column not in chunk:
+                    raise ValueError(f"No '{text_column}' column to score")
+                texts = chunk[text_column].tolist()
+                # With on_error="raise", errors are marked by the workers and
+                # raised here, where their row numbers are known.
+                pending.append((executor.submit(
+                                    score_chunk, texts,
+                                    "mark" if on_error == "raise"
+                                    else on_error),
+                                chunk, position, read))
+                read += len(chunk)
+                if len(pending) >= 2 * workers:
+                    break
+            if not pending:
+                break
+
+            future, chunk, position, first_row = pending.popleft()
+            batch = future.result()
+            records = [record._replace(index=first_row + record.index,
+                                       source=path)
+                       for record in batch["errors"]]
+            if on_error == "raise":
+                raise_first(records, f"{path}: ")
+            if errors is not None:
+                errors.extend(records)
+            add_cache_stats(cache_stats, batch)
+            res_df = batch_to_frame(batch, index=chunk.index)
+            df = chunk.drop(res_df.columns, axis=1, errors="ignore")
+            df = df.join(res_df, how="inner" if on_error == "skip" else "left")
+            if columns is None:
+                columns = list(df.columns)
+                _write_chunk(df, f, jsonl, header=True)
+            else:
+                _write_chunk(df.reindex(columns=columns), f, jsonl,
+                             header=False)
+            f.flush()
+            rows += len(df)
+
+            checkpoint.update(position=position, size=f.tell(),
+                              columns=columns,
+                              rows=checkpoint["rows"] + len(df),
+                              read=first_row + len(chunk))
+            if aggregates is not None:
+                aggregates.add_frame(df, group_column)
+                checkpoint["aggregates"] = aggregates.to_dict()
+            _save_checkpoint(output, checkpoint)
+
+    if aggregates is not None:
+        aggregates.save(aggregates_path)
+
+    if os.path.exists(checkpoint_path(output)):
+        os.remove(checkpoint_path(output))
+    return rows
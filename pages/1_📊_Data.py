@@ -1,10 +1,15 @@
-import pandas as pd
+import math
+import os
 import streamlit as st
-from collections import Counter
-import altair as alt
-from util import write_horizontally, str_to_list, get_list_length, init_page
-from st_aggrid import AgGrid, GridOptionsBuilder
-from st_aggrid.shared import GridUpdateMode
+import dataset
+from util import write_horizontally, init_page
+
+SCIENTIST_QUERIES = ["scientist", "data scientist"]
+ENGINEER_QUERIES = ["engineer", "software engineer"]
+NUM_TOP_STEMS = 10
+# Columns shown in the grid until others are picked
+GRID_COLUMNS = ["title", "company_name", "result", "location", "query",
+                "description"]
 
 
 def main():
@@ -20,118 +25,136 @@ def main():
     - _Overall_ data consists of both _Scientist_ and _Engineer_ data.
     ''')
 
-    df = create_df()
-    df_sci = df[(df["query"] == "scientist") |
-                (df["query"] == "data scientist")]
-    df_eng = df[(df["query"] == "engineer") |
-                (df["query"] == "software engineer")]
+    df, aggregates, index = create_df()
 
     option = st.selectbox(
         "Dataset to View", ("Overall", "Scientist", "Engineer"))
 
     if option == "Scientist":
-        display_analysis(df_sci, "Scientist")
+        display_analysis(df, index, index.any_of("query", SCIENTIST_QUERIES),
+                         aggregates.combined(SCIENTIST_QUERIES), "Scientist")
     elif option == "Engineer":
-        display_analysis(df_eng, "Engineer")
+        display_analysis(df, index, index.any_of("query", ENGINEER_QUERIES),
+                         aggregates.combined(ENGINEER_QUERIES), "Engineer")
     else:
-        display_analysis(df, "Overall")
+        display_analysis(df, index, None, aggregates.combined(), "Overall")
 
 
 def aggrid_interactive_table(df):
-    """Creates an st-aggrid interactive table based on a dataframe."""
+    """Creates an st-aggrid interactive table based on a dataframe.
+    Returns the selected rows."""
+    from st_aggrid import AgGrid, GridOptionsBuilder
+    from st_aggrid.shared import GridUpdateMode
+
     options = GridOptionsBuilder.from_dataframe(
         df, enableRowGroup=True, enableValue=True, enablePivot=True
     )
     options.configure_side_bar()
     options.configure_selection("single")
-    AgGrid(
+    response = AgGrid(
         df,
         enable_enterprise_modules=True,
         gridOptions=options.build(),
-        update_mode=GridUpdateMode.MODEL_CHANGED,
+        update_mode=GridUpdateMode.SELECTION_CHANGED,
         allow_unsafe_jscode=True,
         height=500)
+    return response["selected_rows"]
+
+
+def paged_table(df, ids):
+    """Shows one page of the ads ids in the grid, with the columns picked,
+    and the full description of the ad selected in it."""
+    columns = st.multiselect(
+        "Columns", list(df.columns),
+        default=[column for column in GRID_COLUMNS if column in df])
+    left, right = st.columns(2)
+    with left:
+        page_size = st.selectbox("Rows per page", (25, 50, 100), index=1)
+    with right:
+        num_pages = max(1, math.ceil(len(ids) / page_size))
+        # Keyed by the rows, so a new filter starts back at the first page
+        page = st.number_input(f"Page (of {num_pages})", min_value=1,
+                               max_value=num_pages, value=1,
+                               key=f"page-{len(ids)}-{page_size}")
+
+    rows = dataset.page_of(df, ids, page - 1, page_size, columns)
+    selected = aggrid_interactive_table(rows)
+    if selected:
+        # Only the start of each description is sent to the grid; fetch the
+        # rest for the one ad selected
+        ad = df.iloc[selected[0]["ad_id"]]
+        with st.expander(f"{ad['title']} - {ad['company_name']}",
+                         expanded=True):
+            st.write(ad["description"])
+
+
+@st.experimental_memo
+def load_df(path, mtime):
+    # mtime is only part of the cache key, so a rebuilt dataset is reloaded
+    return dataset.read_dataset(path)
+
+
+@st.experimental_memo
+def load_aggregates(path, mtime):
+    return dataset.read_aggregates(path)
+
+
+@st.experimental_singleton
+def load_index(path, mtime):
+    # A singleton rather than a memo, so the memory-mapped ids aren't copied
+    return dataset.read_index(path)
+
 
 def create_df():
-    # Read CSV
-    df = pd.read_csv("data/google/all.csv")
-    # Drop unneeded columns
-    df.drop(["Unnamed: 0.1", "Unnamed: 0", "extensions", "detected_extensions",
-             "job_id", "thumbnail", "via"], axis=1, inplace=True)
-    # Drop rows with same descriptions
-    df.drop_duplicates(subset=["description"], inplace=True)
-    # Drop rows w/o coded words lists
-    df = df[df.masculine_coded_words != "masculine_coded_words"]
-
-    # Convert strings to lists
-    df["masculine_coded_words"] = df.masculine_coded_words.apply(
-        lambda s: str_to_list(s))
-    df["feminine_coded_words"] = df.feminine_coded_words.apply(
-        lambda s: str_to_list(s))
-
-    # Get number of masculine/feminine words
-    df["num_masculine_words"] = df["masculine_coded_words"].apply(
-        lambda x: get_list_length(x))
-    df["num_feminine_words"] = df["feminine_coded_words"].apply(
-        lambda x: get_list_length(x))
-
-    # Drop rows with nan values
-    df = df.dropna()
-
-    # Move result column to right of company_name
-    res_column = df.pop('result')
-    df.insert(2, 'result', res_column)
-
-    return df
-
-
-def get_most_common_df(df, coding):
+    # Build the dataset from the CSV if it's missing or out of date
+    if dataset.is_stale():
+        dataset.build_dataset()
+    df = load_df(dataset.DATASET, os.path.getmtime(dataset.DATASET))
+    aggregates = load_aggregates(dataset.AGGREGATES,
+                                 os.path.getmtime(dataset.AGGREGATES))
+    index = load_index(dataset.INDEX, os.path.getmtime(dataset.INDEX))
+    try:
+        dataset.check_index(index, df)
+    except ValueError:
+        # Built from another dataset, so its ids would point at the wrong ads
+        dataset.build_dataset()
+        df = dataset.read_dataset()
+        aggregates = dataset.read_aggregates()
+        index = dataset.read_index(df=df)
+    return df, aggregates, index
+
+
+def get_most_common_df(stats, coding):
+    import pandas as pd
+
     NUM_TOP_WORDS = 20
 
-    # Determine column
-    if coding == "masculine":
-        column = "masculine_coded_words"
-    elif coding == "feminine":
-        column = "feminine_coded_words"
-    else:
-        raise Exception(
-            "Invalid coding given! Valid codings: masculine, feminine")
-
-    # Get list of word lists
-    word_lists = df[column].tolist()
-    # Flatten list
-    flat_list = []
-    for sublist in word_lists:
-        try:
-            for item in sublist:
-                flat_list.append(item.strip())
-        except Exception:
-            continue
-
-    # Get most common words...
-    word_counter = Counter(flat_list)
-    most_common_list = word_counter.most_common(NUM_TOP_WORDS)
+    # Get most common words from the precomputed counts...
+    most_common_list = stats.most_common(coding, NUM_TOP_WORDS)
     # And return it as a DataFrame
     most_common_df = pd.DataFrame(most_common_list, columns=["word", "count"])
     return most_common_df
 
 
-def display_analysis(df, title):
+def display_analysis(df, index, ids, stats, title):
+    # Loaded here so the page text renders before the charting libraries
+    import altair as alt
+    import pandas as pd
+
     # Get number of jobs
-    num_jobs = df.shape[0]
+    num_jobs = stats.num_ads
 
     # Get average number of masc/fem words
-    avg_num_masc_words = int(df.describe()["num_masculine_words"]["mean"])
-    avg_num_fem_words = int(df.describe()["num_feminine_words"]["mean"])
+    avg_num_masc_words = int(stats.mean_masculine_words())
+    avg_num_fem_words = int(stats.mean_feminine_words())
 
     # Get number of masc/fem results
-    res_df = df.groupby("result").size().reset_index().reindex(
-        [4, 1, 2, 0, 3])
-    res_df.columns = ["coding", "num_ads"]
+    res_df = pd.DataFrame(stats.result_counts(),
+                          columns=["coding", "num_ads"])
 
     # Get most common word dfs
-    masc_word_df = get_most_common_df(df, "masculine")
-    fem_word_df = get_most_common_df(df, "feminine")
+    masc_word_df = get_most_common_df(stats, "masculine")
+    fem_word_df = get_most_common_df(stats, "feminine")
 
     # Create graphs
     res_graph = alt.Chart(res_df).mark_bar().encode(
@@ -165,11 +188,32 @@ def display_analysis(df, title):
 
     st.subheader("Data Table")
     st.write('''
-    Looking for results for a specific company or job title? Click on _Filters_.
+    Looking for ads from specific companies, or ads using specific coded words?
+    Pick them below. Looking for a job title on this page? Click on _Filters_.
 
-    Too many columns? Hide a few by clicking on _Columns_.
+    Too many columns? Pick the ones to show. Select a row to read its full
+    description.
     ''')
-    aggrid_interactive_table(df)
+    # Filters are answered from the inverted index, so only the matching rows
+    # are ever sent to the grid
+    filters = {"company_name": st.multiselect(
+                   "Companies", index.keys("company_name")),
+               "masculine_stems": st.multiselect(
+                   "Ads using masculine stems",
+                   index.keys("masculine_stems")),
+               "feminine_stems": st.multiselect(
+                   "Ads using feminine stems", index.keys("feminine_stems"))}
+    ids = index.filter(filters, ids)
+    st.write(f"**{len(ids)}** matching ads")
+
+    if filters["masculine_stems"] or filters["feminine_stems"]:
+        st.write("Stems most often used in the matching ads:")
+        write_horizontally(*[
+            pd.DataFrame(index.cooccurrence(f"{coding}_stems", ids,
+                                            NUM_TOP_STEMS),
+                         columns=[f"{coding} stem", "ads"])
+            for coding in ("masculine", "feminine")])
+    paged_table(df, ids)
 
 
 main()
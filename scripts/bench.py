@@ -0,0 +1,249 @@
+'''
+Benchmarks genderdecoder and the data pipeline on the bundled job ads and on
+synthetic ads of configurable size.
+
+Run from the repository root:
+
+    python -m scripts.bench -o bench.json
+    python -m scripts.bench --compare bench.json --threshold 0.2
+
+With --compare, exits with status 1 if any metric is worse than the baseline
+by more than the threshold (a fraction, e.g. 0.2 = 20%). Also exits with
+status 1 if "import genderdecoder" takes longer than IMPORT_TARGET_MS.
+'''
+import argparse
+import glob
+import json
+import os
+import platform
+import random
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+import dataset
+import genderdecoder.gd as gd
+from genderdecoder import wordlists
+
+CSVS = sorted(glob.glob("data/google/*.csv") +
+              glob.glob("data/indeed/*_*.csv"))
+# Most "import genderdecoder" may take, however it compares to the baseline
+IMPORT_TARGET_MS = 50
+
+
+def load_ads():
+    '''
+    Returns the job descriptions of the bundled CSVs.
+    '''
+    ads = []
+    for csv in CSVS:
+        ads.extend(d for d in pd.read_csv(csv)["description"]
+                   if isinstance(d, str))
+    return ads
+
+
+def synthetic_ads(n, words_per_ad=800, seed=0, vocabulary=None):
+    '''
+    Returns n synthetic job ads of words_per_ad words each, drawn from the
+    vocabulary (default: the bundled ads' words) with ~2% coded words.
+    '''
+    rng = random.Random(seed)
+    if vocabulary is None:
+        vocabulary = sorted({w for ad in load_ads() for w in ad.split()})
+    coded = [stem + suffix
+             for stem in (wordlists.masculine_coded_words +
+                          wordlists.feminine_coded_words)
+             for suffix in ("", "s", "ing", "ive")]
+    ads = []
+    for _ in range(n):
+        words = [rng.choice(coded) if rng.random() < 0.02
+                 else rng.choice(vocabulary)
+                 for _ in range(words_per_ad)]
+        ads.append(" ".join(words))
+    return ads
+
+
+def percentile(sorted_values, p):
+    index = min(len(sorted_values) - 1, int(round(p * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def time_it(func, repeat=3):
+    '''
+    Returns the best wall time of repeat calls to func.
+    '''
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def bench_assess(name, ads, metrics):
+    latencies = []
+    for ad in ads:
+        start = time.perf_counter()
+        gd.assess(ad)
+        latencies.append(time.perf_counter() - start)
+    latencies.sort()
+    for p in (0.5, 0.9, 0.99):
+        metrics[f"{name}.assess.p{int(p * 100)}_ms"] = (
+            percentile(latencies, p) * 1000, "lower")
+    metrics[f"{name}.assess.ads_per_s"] = (len(ads) / sum(latencies), "higher")
+
+    seconds = time_it(lambda: gd.assess_many(ads))
+    metrics[f"{name}.assess_many.ads_per_s"] = (len(ads) / seconds, "higher")
+
+
+def bench_pipeline(metrics):
+    '''
+    Times determine_bias() and building / loading the Data page dataset on a
+    temporary copy of the bundled Google CSVs.
+    '''
+    from scripts.google import determine_bias
+
+    tmp = tempfile.mkdtemp()
+    try:
+        frames = []
+        for csv in sorted(glob.glob("data/google/*.csv")):
+            copy = os.path.join(tmp, os.path.basename(csv))
+
+            def rescore():
+                shutil.copy(csv, copy)
+                determine_bias(copy)
+            metrics[f"determine_bias.{os.path.basename(csv)}_s"] = (
+                time_it(rescore), "lower")
+            df = pd.read_csv(csv)
+            df["query"] = os.path.basename(csv).replace("_", " ").replace(".csv", "")
+            frames.append(df)
+
+        all_csv = os.path.join(tmp, "all.csv")
+        pd.concat(frames).to_csv(all_csv, index=False)
+        parquet = os.path.join(tmp, "all.parquet")
+        aggregates = os.path.join(tmp, "all.aggregates.json")
+        index = os.path.join(tmp, "all.index.arrow")
+        metrics["build_dataset_s"] = (time_it(
+            lambda: dataset.build_dataset(all_csv, parquet, aggregates,
+                                          index)),
+            "lower")
+        metrics["read_dataset_s"] = (time_it(
+            lambda: dataset.read_dataset(parquet), repeat=10), "lower")
+    finally:
+        shutil.rmtree(tmp)
+
+
+def bench_import(metrics, repeat=5):
+    '''
+    Times "import genderdecoder", and the Streamlit app's helpers in util, in
+    fresh interpreters.
+    '''
+    for module in ("genderdecoder", "util"):
+        code = (f"import time; start = time.perf_counter(); import {module}; "
+                "print(time.perf_counter() - start)")
+        times = [float(subprocess.check_output([sys.executable, "-c", code]))
+                 for _ in range(repeat)]
+        metrics[f"import_{module}_ms"] = (statistics.median(times) * 1000,
+                                          "lower")
+
+
+def peak_rss_mb():
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and kilobytes elsewhere
+    return rss / 2**20 if sys.platform == "darwin" else rss / 2**10
+
+
+def run(sizes, words_per_ad):
+    metrics = {}
+    bench_import(metrics)
+
+    ads = load_ads()
+    bench_assess("bundled", ads, metrics)
+
+    vocabulary = sorted({w for ad in ads for w in ad.split()})
+    for size in sizes:
+        bench_assess(f"synthetic_{size}",
+                     synthetic_ads(size, words_per_ad, vocabulary=vocabulary),
+                     metrics)
+
+    bench_pipeline(metrics)
+    metrics["peak_rss_mb"] = (peak_rss_mb(), "lower")
+
+    return {"python": platform.python_version(),
+            "machine": platform.machine(),
+            "metrics": {name: {"value": value, "better": better}
+                        for name, (value, better) in metrics.items()}}
+
+
+def compare(results, baseline, threshold):
+    '''
+    Prints each metric against the baseline and returns the names of those
+    that got worse by more than threshold.
+    '''
+    regressions = []
+    for name, metric in results["metrics"].items():
+        base = baseline["metrics"].get(name)
+        if base is None or not base["value"]:
+            continue
+        change = metric["value"] / base["value"] - 1
+        worse = change if metric["better"] == "lower" else -change
+        flag = ""
+        if worse > threshold:
+            regressions.append(name)
+            flag = "  <-- REGRESSION"
+        print(f"{name:45} {base['value']:12.3f} -> {metric['value']:12.3f} "
+              f"({change:+.1%}){flag}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("-o", "--output", help="JSON file to write results to.")
+    parser.add_argument("--compare", metavar="BASELINE",
+                        help="JSON results to compare against.")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="Allowed slowdown vs. the baseline "
+                             "(default: %(default)s).")
+    parser.add_argument("--sizes", default="1000",
+                        help="Comma-separated numbers of synthetic ads "
+                             "(default: %(default)s).")
+    parser.add_argument("--words", type=int, default=800,
+                        help="Words per synthetic ad (default: %(default)s).")
+    args = parser.parse_args(argv)
+
+    sizes = [int(size) for size in args.sizes.split(",") if size]
+    results = run(sizes, args.words)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    status = 0
+    import_ms = results["metrics"]["import_genderdecoder_ms"]["value"]
+    if import_ms > IMPORT_TARGET_MS:
+        print(f"import genderdecoder took {import_ms:.1f} ms, over the "
+              f"{IMPORT_TARGET_MS} ms target")
+        status = 1
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"{len(regressions)} metric(s) regressed by more than "
+                  f"{args.threshold:.0%}")
+            return 1
+    else:
+        for name, metric in results["metrics"].items():
+            print(f"{name:45} {metric['value']:12.3f}")
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
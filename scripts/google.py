@@ -1,6 +1,11 @@
-from keys import GOOGLE_SEARCH_API_KEY
+import json
+import queue
+import threading
+import urllib.parse
+import urllib.request
 import genderdecoder.gd as gd
-from serpapi import GoogleSearch
+from genderdecoder.corpus import default_workers, make_executor, score_chunk
+from genderdecoder.results import concat_tables
 import pandas as pd
 
 QUERIES = [
@@ -11,34 +16,85 @@ QUERIES = [
 ]
 
 NUM_JOBS = 150
+OFFSET = 10
+
+# Columns of the jobs_results records that are written to the CSVs
+JOB_COLUMNS = ["title", "company_name", "location", "via", "description",
+               "thumbnail", "extensions", "detected_extensions", "job_id"]
+# Job columns holding lists or dicts, whose keys change from page to page
+NESTED_COLUMNS = ["extensions", "detected_extensions"]
+
+
+class SerpApiClient:
+    '''
+    Searches Google Jobs through SerpApi.
+    '''
+
+    def __init__(self, api_key=None):
+        # Imported here so other clients work without SerpApi or keys.py
+        from serpapi import GoogleSearch
+        if api_key is None:
+            from keys import GOOGLE_SEARCH_API_KEY as api_key
+        self._search = GoogleSearch
+        self.api_key = api_key
+
+    def search(self, params):
+        return self._search({"api_key": self.api_key, **params}).get_dict()
+
+
+class HttpJobsClient:
+    '''
+    Searches a server that answers GET requests with SerpApi-style JSON, e.g.
+    a local fixture server standing in for SerpApi.
+    '''
+
+    def __init__(self, url, timeout=30):
+        self.url = url
+        self.timeout = timeout
+
+    def search(self, params):
+        url = f"{self.url}?{urllib.parse.urlencode(params)}"
+        with urllib.request.urlopen(url, timeout=self.timeout) as response:
+            return json.load(response)
 
 
 def main():
-    # For each query...
-    for query in QUERIES:
-        print(f"========== Query: {query}")
-        # Replace spaces with underscores for csv name
-        csv_name = f"data/google/{query.replace(' ', '_')}.csv"
-        # Get data and write to csv
-        get_data(query, csv_name)
-        # Get gender info and write to same csv
-        determine_bias(csv_name)
-
-
-def get_data(query, csv):
+    run_pipeline(QUERIES, SerpApiClient())
+
+
+def csv_name(query):
+    # Replace spaces with underscores for csv name
+    return f"data/google/{query.replace(' ', '_')}.csv"
+
+
+def results_name(csv):
+    # The compact results file written beside a scored CSV
+    return csv[:-len(".csv")] + ".results.arrow"
+
+
+def encode_nested(df):
+    '''
+    Returns a copy of df with the lists and dicts of NESTED_COLUMNS as JSON
+    strings, so every page's results table has the same column types.
     '''
-    Gets data by running API calls and writes it to a CSV.
+    df = df.copy()
+    for column in NESTED_COLUMNS:
+        df[column] = [None if value is None or value != value
+                      else json.dumps(value) for value in df[column]]
+    return df
 
-    csv - The name of the .csv to save the data to.
+
+def fetch_pages(query, client, pages, num_jobs=NUM_JOBS):
     '''
-    OFFSET = 10
-    df = pd.DataFrame()
+    Fetches the jobs_results pages for a query and puts each page's records on
+    the pages queue as (query, records).
 
+    client - Any object with a search(params) method returning SerpApi JSON.
+    '''
     start = 0
-    while start < NUM_JOBS:
-        print(f"Start: {start}")
+    while start < num_jobs:
+        print(f"{query}: start {start}")
         params = {
-            "api_key": GOOGLE_SEARCH_API_KEY,
             "engine": "google_jobs",
             "google_domain": "google.com",
             "q": query,
@@ -47,20 +103,87 @@ def get_data(query, csv):
             "location": "United States",
             "start": start  # Offset
         }
-        search = GoogleSearch(params)
-        results = search.get_dict()
-
         try:
-            res_dict_list = results["jobs_results"]
-            res_df = pd.DataFrame.from_records(res_dict_list)
-            df = pd.concat([df, res_df])
-        except:
-            print("- An exception occurred!")
+            records = client.search(params)["jobs_results"]
+        except Exception as e:
+            print(f"- {query}: stopped at start {start} ({e!r})")
             break
-
+        pages.put((query, records))
         start += OFFSET
 
-    df.to_csv(csv)
+
+def run_pipeline(queries, client, num_jobs=NUM_JOBS, workers=None,
+                 csv_for=csv_name):
+    '''
+    Fetches, scores and writes job ads for each query in one pipeline.
+
+    Each query's pages are fetched on its own thread and put on a bounded
+    queue. A scoring thread submits each page's descriptions to a process
+    pool, and the main thread appends each scored page to the query's CSV as
+    soon as it is ready, so pages are scored and written while later pages
+    are still being fetched. Once every page is in, each query's results are
+    also written beside its CSV, as in determine_bias().
+
+    client - Any object with a search(params) method returning SerpApi JSON,
+             e.g. SerpApiClient or HttpJobsClient.
+    csv_for - Function returning the CSV to write a query's jobs to.
+
+    Returns a dict of query -> number of jobs written.
+    '''
+    workers = workers or default_workers()
+    pages = queue.Queue(maxsize=2 * workers)
+    scored = queue.Queue(maxsize=2 * workers)
+    written = {query: 0 for query in queries}
+    tables = {query: [] for query in queries}
+
+    def fetch_all():
+        fetchers = [threading.Thread(target=fetch_pages,
+                                     args=(query, client, pages, num_jobs))
+                    for query in queries]
+        for fetcher in fetchers:
+            fetcher.start()
+        for fetcher in fetchers:
+            fetcher.join()
+        pages.put(None)
+
+    def score_all(executor):
+        while True:
+            page = pages.get()
+            if page is None:
+                scored.put(None)
+                return
+            query, records = page
+            texts = [record.get("description") for record in records]
+            scored.put((query, records, executor.submit(score_chunk, texts)))
+
+    with make_executor(workers) as executor:
+        threading.Thread(target=fetch_all, daemon=True).start()
+        threading.Thread(target=score_all, args=(executor,),
+                         daemon=True).start()
+
+        while True:
+            page = scored.get()
+            if page is None:
+                break
+            query, records, future = page
+            df = pd.DataFrame.from_records(records).reindex(columns=JOB_COLUMNS)
+            df = pd.concat([df, gd.batch_to_frame(future.result())], axis=1)
+            first = written[query] == 0
+            df.to_csv(csv_for(query), index=False, mode="w" if first else "a",
+                      header=first)
+            written[query] += len(df)
+            tables[query].append(gd.to_table(
+                encode_nested(df), columns=[column for column in JOB_COLUMNS
+                                            if column != 'description'],
+                texts=df['description']))
+
+    for query, query_tables in tables.items():
+        if query_tables:
+            gd.write_results(results_name(csv_for(query)),
+                             concat_tables(query_tables))
+    for query, count in written.items():
+        print(f"========== {query}: {count} jobs -> {csv_for(query)}")
+    return written
 
 
 def determine_bias(csv):
@@ -69,27 +192,25 @@ def determine_bias(csv):
     Also adds columns for number of masculine and feminine coded words in 
     each job's lists.
 
-    csv - The name of the .csv to read from and save the data to.
+    csv - The name of the .csv to read from and save the data to. The results
+          are also written, with the other job columns, in the compact
+          format of genderdecoder.write_results(), so analyses can read real
+          word lists instead of parsing them from the CSV.
     '''
     df = pd.read_csv(csv)
 
-    # Assess each row using genderdecoder
-    df['res'] = df.apply(
-        lambda row: gd.assess(row['description']), axis=1)
-    # Turn res dict into Series
-    df['res'].apply(pd.Series)
-    # Drop res column and combine Series with rest of df
-    df = pd.concat([df.drop(['res'], axis=1),
-                    df['res'].apply(pd.Series)], axis=1)
-
-    # Get length of masculine and feminine coded word lists
-    if 'num_masculine_words' in df and 'num_feminine_words' in df:
-        df['num_masculine_words'] = df.apply(
-            lambda row: len(row['masculine_coded_words']), axis=1)
-        df['num_feminine_words'] = df.apply(
-            lambda row: len(row['feminine_coded_words']), axis=1)
+    # Assess all rows at once using genderdecoder
+    res_df = gd.batch_to_frame(gd.assess_many(df['description']),
+                               index=df.index)
+    # Replace any previous results with the new ones
+    df = pd.concat([df.drop(res_df.columns, axis=1, errors='ignore'),
+                    res_df], axis=1)
 
     df.to_csv(csv)
+    gd.write_results(results_name(csv), df,
+                     columns=[column for column in JOB_COLUMNS
+                              if column in df and column != 'description'],
+                     texts=df['description'])
 
 
 if __name__ == "__main__":
@@ -0,0 +1,80 @@
+'''
+Checks that genderdecoder.tokenize(), assess() and assess_many() still
+produce the same results as the original per-character tokenization and
+nested word x stem loops on the bundled job ads.
+
+Run from the repository root:
+
+    python -m scripts.regression
+'''
+import glob
+import re
+import sys
+
+import pandas as pd
+
+import genderdecoder.gd as gd
+from genderdecoder import wordlists
+
+CSVS = sorted(glob.glob("data/google/*.csv"))
+
+
+def legacy_tokenize(ad_text):
+    '''
+    The per-character tokenization assess() used before normalize.py.
+    '''
+    ad_text = ''.join([i if ord(i) < 128 else ' ' for i in ad_text])
+    ad_text = re.sub("[\\s]", " ", ad_text, 0, 0)
+    ad_text = re.sub("[\\.\\t\\,\\:;\\(\\)\\.]", "", ad_text, 0, 0).split(" ")
+    return [ad for ad in ad_text if ad != ""]
+
+
+def legacy_coded_words(ad_text):
+    '''
+    The matching assess() used before the prefix matcher.
+    '''
+    ad_text = legacy_tokenize(ad_text)
+
+    masculine_coded_words = [adword for adword in ad_text
+                             for word in wordlists.masculine_coded_words
+                             if adword.startswith(word)]
+    feminine_coded_words = [adword for adword in ad_text
+                            for word in wordlists.feminine_coded_words
+                            if adword.startswith(word)]
+    return masculine_coded_words, feminine_coded_words
+
+
+def main():
+    checked = 0
+    failures = 0
+    for csv in CSVS:
+        df = pd.read_csv(csv)
+        df = df[df["description"].apply(lambda d: isinstance(d, str))]
+        batch = gd.batch_to_frame(gd.assess_many(df["description"]),
+                                  index=df.index)
+        tokens = gd.tokenize_many(df["description"])
+        for i, desc in df["description"].items():
+            masc, fem = legacy_coded_words(desc)
+            res = gd.assess(desc)
+            checked += 1
+            legacy_tokens = legacy_tokenize(desc)
+            if (gd.tokenize(desc) != legacy_tokens or
+                    tokens[i] != legacy_tokens):
+                failures += 1
+                print(f"- tokenize() mismatch in {csv}, row {i}")
+            if (res["masculine_coded_words"] != masc or
+                    res["feminine_coded_words"] != fem):
+                failures += 1
+                print(f"- Mismatch in {csv}, row {i}")
+            if (batch.at[i, "result"] != res["result"] or
+                    batch.at[i, "masculine_coded_words"] != masc or
+                    batch.at[i, "feminine_coded_words"] != fem):
+                failures += 1
+                print(f"- assess_many() mismatch in {csv}, row {i}")
+
+    print(f"Checked {checked} ads from {len(CSVS)} files, {failures} mismatches")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
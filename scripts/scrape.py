@@ -1,9 +1,18 @@
+import asyncio
+import time
+from urllib.parse import urlsplit
+import aiohttp
 import requests
 from bs4 import BeautifulSoup
 import pandas as pd
 import datetime as dt
 from keys import WEB_SCRAPING_API_KEY
 
+WEB_SCRAPING_API_URL = "https://api.webscrapingapi.com/v1"
+# Responses worth retrying: rate limited or a temporary server error
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+NO_JOB_DESCRIPTION = 'No Job Description'
+
 def make_indeed_url(search_job, search_location=None, job_age=7):
     '''
     This function takes in 3 search parameters and inserts them into an
@@ -70,20 +79,160 @@ def scrape_job_description(job_desc_href):
     '''
     try:
         page = web_scrape_api_call(job_desc_href)
-        soup = BeautifulSoup(page.content, 'html.parser')
-        job_desc = soup.find(id='jobDescriptionText')
-        job_desc = job_desc.text.replace('\n', ' ').replace('\r', '')
+        job_desc = parse_job_description(page.content)
     except:
-        job_desc = 'No Job Description'
+        job_desc = NO_JOB_DESCRIPTION
     return job_desc
 
 
+def parse_job_description(html):
+    '''
+    Extracts the job description text from an indeed.com job page.
+    input:
+        html: str or bytes, the job page
+    output:
+        job_desc, str
+    '''
+    soup = BeautifulSoup(html, 'html.parser')
+    job_desc = soup.find(id='jobDescriptionText')
+    return job_desc.text.replace('\n', ' ').replace('\r', '')
+
+
+class HostRateLimiter:
+    '''
+    Spaces out requests so that no host gets more than rate requests per
+    second. A rate of None or 0 disables the limit.
+    '''
+
+    def __init__(self, rate):
+        self.interval = 1 / rate if rate else 0
+        self._next_request = {}
+
+    async def wait(self, host):
+        if not self.interval:
+            return
+        now = time.monotonic()
+        start = max(now, self._next_request.get(host, now))
+        self._next_request[host] = start + self.interval
+        if start > now:
+            await asyncio.sleep(start - now)
+
+
+async def fetch_job_description(session, url, limiter, api_key=WEB_SCRAPING_API_KEY,
+                                retries=3, backoff=0.5):
+    '''
+    Fetches and parses one job description with a pooled aiohttp session,
+    retrying connection errors and RETRY_STATUSES with exponential backoff.
+    input:
+        session: aiohttp.ClientSession
+        url: str, job page url
+        limiter: HostRateLimiter, applied to the job page's host
+        api_key: str, webscrapingapi key; None to request the url directly
+    output:
+        job_desc, str, NO_JOB_DESCRIPTION if it could not be fetched or parsed
+    '''
+    if api_key:
+        request_url, params = WEB_SCRAPING_API_URL, {"api_key": api_key, "url": url}
+    else:
+        request_url, params = url, None
+    host = urlsplit(url).netloc
+
+    for attempt in range(retries + 1):
+        await limiter.wait(host)
+        try:
+            async with session.get(request_url, params=params) as response:
+                if response.status in RETRY_STATUSES:
+                    raise aiohttp.ClientResponseError(
+                        response.request_info, response.history,
+                        status=response.status)
+                if response.status >= 400:
+                    return NO_JOB_DESCRIPTION
+                html = await response.read()
+            break
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            if attempt == retries:
+                return NO_JOB_DESCRIPTION
+            await asyncio.sleep(backoff * 2 ** attempt)
+
+    try:
+        # Parse off the event loop so other downloads keep flowing
+        return await asyncio.to_thread(parse_job_description, html)
+    except Exception:
+        return NO_JOB_DESCRIPTION
+
+
+async def collect_job_descriptions(urls, concurrency=20, rate=5.0, retries=3,
+                                   backoff=0.5, timeout=30,
+                                   api_key=WEB_SCRAPING_API_KEY):
+    '''
+    Fetches job descriptions concurrently and yields them as they arrive.
+    input:
+        urls: list of job page urls
+        concurrency: int, max number of requests in flight (and pooled
+            connections)
+        rate: float, max requests per second to each job page host. This
+            bounds a run, not just bursts: n urls on one host take at least
+            n / rate seconds (200 s for 1000 job pages at the default 5), so
+            raise it for hosts known to allow more
+        retries: int, retries per url on connection errors and RETRY_STATUSES
+        backoff: float, seconds to wait before the first retry; doubles after
+        timeout: float, seconds allowed per request
+        api_key: str, webscrapingapi key; None to request the urls directly
+    output:
+        async iterator of (url, job_desc) tuples, in completion order
+    '''
+    urls = list(urls)
+    pending = asyncio.Queue()
+    for url in urls:
+        pending.put_nowait(url)
+    done = asyncio.Queue()
+    limiter = HostRateLimiter(rate)
+
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    client_timeout = aiohttp.ClientTimeout(total=timeout)
+    async with aiohttp.ClientSession(connector=connector,
+                                     timeout=client_timeout) as session:
+        async def worker():
+            while not pending.empty():
+                url = pending.get_nowait()
+                try:
+                    job_desc = await fetch_job_description(
+                        session, url, limiter, api_key, retries, backoff)
+                except Exception:
+                    # Every url must be answered, or the loop below waits
+                    # for it forever
+                    job_desc = NO_JOB_DESCRIPTION
+                await done.put((url, job_desc))
+
+        workers = [asyncio.create_task(worker())
+                   for _ in range(min(concurrency, len(urls)))]
+        try:
+            for _ in urls:
+                yield await done.get()
+        finally:
+            for task in workers:
+                task.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+
+
+def fetch_job_descriptions(urls, **kwargs):
+    '''
+    Blocking wrapper around collect_job_descriptions().
+    output:
+        dict of url -> job_desc
+    '''
+    async def collect():
+        return {url: job_desc async for url, job_desc
+                in collect_job_descriptions(urls, **kwargs)}
+    return asyncio.run(collect())
+
+
 def scrape_job_page_meta(job_page_html):
     '''
     This function takes in a html job page and uses beautiful soup to extract each jobs title, company name,
     estimated salary, job description href and then uses that href to open the job description page and
-    extract that job description. While its looping through each job on the job page it is storing the 
-    information in a pandas dataframe.
+    extract that job description. The job descriptions are fetched concurrently once every job on the
+    page has been found, and the information is stored in a pandas dataframe.
     input:
         job_page_html: html response from indeed search request
     output:
@@ -92,26 +241,33 @@ def scrape_job_page_meta(job_page_html):
     page_soup = BeautifulSoup(job_page_html.text, 'lxml')
     df_columns = ['job_title', 'company_name',
                   'company_location', 'est_salary', 'job_href', 'job_desc']
-    jobs_df = pd.DataFrame(columns=df_columns)
+    job_posts = []
     for job in page_soup.find_all('div', {"id": "mosaic-provider-jobcards"}):
         # Lets find the job title
         for href_post in job.find_all('a', href=True):
             if href_post.find('a', href=True):
                 # this is for the url for the job posting
                 job_desc_href = 'https://www.indeed.com'+str(href_post['href'])
-                job_desc = scrape_job_description(job_desc_href)
-                for job_meta in href_post.find_all('div', {"class": "job_seen_beacon"}):
-                    job_title, company_name, company_location, estimated_salary = scrape_job_card(
-                        job_meta)
-                    print(f'{job_title}, {job_desc_href}')
-                    job_dict = {'job_title': job_title,
-                                'company_name': [company_name],
-                                'company_location': [company_location],
-                                'est_salary': [estimated_salary],
-                                'job_href': [job_desc_href],
-                                'job_desc': [job_desc]}
-                    j_df = pd.DataFrame.from_dict(job_dict)
-                    jobs_df = jobs_df.append(j_df, ignore_index=True)
+                job_posts.append((job_desc_href, href_post))
+
+    # Fetch all job descriptions concurrently
+    job_descs = fetch_job_descriptions(
+        [job_desc_href for job_desc_href, _ in job_posts])
+
+    rows = []
+    for job_desc_href, href_post in job_posts:
+        job_desc = job_descs[job_desc_href]
+        for job_meta in href_post.find_all('div', {"class": "job_seen_beacon"}):
+            job_title, company_name, company_location, estimated_salary = scrape_job_card(
+                job_meta)
+            print(f'{job_title}, {job_desc_href}')
+            rows.append({'job_title': job_title,
+                         'company_name': company_name,
+                         'company_location': company_location,
+                         'est_salary': estimated_salary,
+                         'job_href': job_desc_href,
+                         'job_desc': job_desc})
+    jobs_df = pd.DataFrame(rows, columns=df_columns)
     return jobs_df
 
 
@@ -158,7 +314,7 @@ def web_scrape_api_call(url_to_scrape):
     sends the url that we would like to scrape to the webscrapingapi
     so that our calls can be ananomyzed. 
     '''
-    url = "https://api.webscrapingapi.com/v1"
+    url = WEB_SCRAPING_API_URL
     params = {
         "api_key": WEB_SCRAPING_API_KEY,
         "url": url_to_scrape
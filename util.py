@@ -1,8 +1,11 @@
-import streamlit as st
-import numpy as np
+import html
+
+HIGHLIGHT_COLORS = {"masculine": "#9fc5e8", "feminine": "#f4b6c2"}
 
 
 def write_horizontally(a, b):
+    import streamlit as st
+
     col1, col2 = st.columns(2)
     # Left Column
     with col1:
@@ -17,14 +20,14 @@ def str_to_list(s):
         s = s.replace("'", "").strip()
         return s[1:-1].split(",")
     except Exception:
-        return np.nan
+        return float("nan")
 
 
 def get_list_length(l):
     try:
         return int(len(l))
     except Exception:
-        return np.nan
+        return float("nan")
 
 
 def get_ordered_list(l):
@@ -37,7 +40,31 @@ def get_ordered_list(l):
     return list_str
 
 
+def highlight_spans(text, spans):
+    """
+    Returns text as HTML with each span from assess(text, spans=True)
+    highlighted in the color of its coding.
+    """
+    parts = []
+    last = 0
+    for span in spans:
+        # A word matching several stems has one span per stem; mark it once
+        if span["start"] < last:
+            continue
+        parts.append(html.escape(text[last:span["start"]]))
+        color = HIGHLIGHT_COLORS[span["coding"]]
+        parts.append(f'<mark style="background-color: {color}" '
+                     f'title="{span["coding"]}: {span["stem"]}-">'
+                     f'{html.escape(text[span["start"]:span["end"]])}</mark>')
+        last = span["end"]
+    parts.append(html.escape(text[last:]))
+    # Kept on one HTML block so Streamlit doesn't render it as Markdown
+    return "<div>" + "".join(parts).replace("\n", "<br>") + "</div>"
+
+
 def init_page(page):
+    import streamlit as st
+
     st.set_page_config(
         page_title=f"{page} | Gender Decoder",
     )